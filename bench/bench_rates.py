@@ -0,0 +1,127 @@
+"""
+Бенчмарк RatesService против FakeProviderServer (без сети).
+
+    python -m bench.bench_rates --iterations 200 --concurrency 50 --json bench_output.json
+
+Для каждого сценария считает задержку get_rate на холодном сервисе
+(p50/p90/p99), число запросов к провайдерам на один вызов и пропускную
+способность при N одновременных вызовах на общем сервисе.
+"""
+from __future__ import annotations
+
+import argparse
+import asyncio
+import json
+import sys
+import time
+from typing import Dict, List, Tuple
+
+from src.fake_provider import FakeProviderServer
+from src.rates import RatesService
+
+
+SCENARIOS: Dict[str, Tuple[Tuple[str, str], Dict[str, float]]] = {
+    "fiat": (("EUR", "RUB"), {}),
+    "crypto": (("BTC", "USD"), {}),
+    "crypto_to_crypto": (("ETH", "BTC"), {}),
+    # Основной фиатный провайдер и CoinGecko лежат - работают только запасные пути
+    "failure_fallback": (("EUR", "RUB"), {"api.exchangerate-api.com": 1.0, "api.coingecko.com": 1.0}),
+}
+
+
+def percentile(samples: List[float], p: float) -> float:
+    if not samples:
+        return 0.0
+    ordered = sorted(samples)
+    k = min(len(ordered) - 1, max(0, round(p / 100 * (len(ordered) - 1))))
+    return ordered[k]
+
+
+async def cold_lookups(pair: Tuple[str, str], host_errors: Dict[str, float], iterations: int, latency: float) -> dict:
+    samples: List[float] = []
+    calls: List[int] = []
+    failures = 0
+    for i in range(iterations):
+        server = FakeProviderServer(latency=latency, host_error_rates=host_errors, seed=i)
+        rates = RatesService("bench", transport=server)
+        started = time.perf_counter()
+        value = await rates.get_rate(*pair)
+        samples.append(time.perf_counter() - started)
+        calls.append(server.total_requests)
+        failures += value is None
+        await rates.close()
+    return {
+        "iterations": iterations,
+        "p50_ms": percentile(samples, 50) * 1000,
+        "p90_ms": percentile(samples, 90) * 1000,
+        "p99_ms": percentile(samples, 99) * 1000,
+        "upstream_calls_per_lookup": sum(calls) / len(calls),
+        "failures": failures,
+    }
+
+
+async def concurrent_lookups(
+    pair: Tuple[str, str], host_errors: Dict[str, float], concurrency: int, rounds: int, latency: float
+) -> dict:
+    server = FakeProviderServer(latency=latency, host_error_rates=host_errors, seed=0)
+    rates = RatesService("bench", transport=server)
+    started = time.perf_counter()
+    for _ in range(rounds):
+        await asyncio.gather(*(rates.get_rate(*pair) for _ in range(concurrency)))
+    elapsed = time.perf_counter() - started
+    await rates.close()
+    lookups = concurrency * rounds
+    return {
+        "concurrency": concurrency,
+        "lookups": lookups,
+        "throughput_per_s": lookups / elapsed if elapsed else 0.0,
+        "upstream_calls": server.total_requests,
+        "upstream_calls_per_lookup": server.total_requests / lookups,
+    }
+
+
+async def run(iterations: int, concurrency: int, rounds: int, latency: float) -> dict:
+    results = {}
+    for name, (pair, host_errors) in SCENARIOS.items():
+        results[name] = {
+            "pair": "/".join(pair),
+            "cold": await cold_lookups(pair, host_errors, iterations, latency),
+            "concurrent": await concurrent_lookups(pair, host_errors, concurrency, rounds, latency),
+        }
+    return {
+        "python": sys.version.split()[0],
+        "latency_ms": latency * 1000,
+        "scenarios": results,
+    }
+
+
+def print_report(report: dict) -> None:
+    print(f"{'scenario':<18} {'p50ms':>8} {'p90ms':>8} {'p99ms':>8} {'calls/op':>9} {'ops/s':>10} {'calls/op@N':>11}")
+    for name, r in report["scenarios"].items():
+        cold, conc = r["cold"], r["concurrent"]
+        print(
+            f"{name:<18} {cold['p50_ms']:>8.2f} {cold['p90_ms']:>8.2f} {cold['p99_ms']:>8.2f} "
+            f"{cold['upstream_calls_per_lookup']:>9.2f} {conc['throughput_per_s']:>10.0f} "
+            f"{conc['upstream_calls_per_lookup']:>11.4f}"
+        )
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="RatesService benchmark")
+    parser.add_argument("--iterations", type=int, default=100, help="холодных вызовов на сценарий")
+    parser.add_argument("--concurrency", type=int, default=50, help="одновременных вызовов")
+    parser.add_argument("--rounds", type=int, default=20, help="волн одновременных вызовов")
+    parser.add_argument("--latency-ms", type=float, default=5.0, help="задержка фейкового провайдера")
+    parser.add_argument("--json", dest="json_path", help="куда записать отчёт в JSON")
+    args = parser.parse_args()
+
+    report = asyncio.run(run(args.iterations, args.concurrency, args.rounds, args.latency_ms / 1000))
+    print_report(report)
+    if args.json_path:
+        with open(args.json_path, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
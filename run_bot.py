@@ -5,6 +5,7 @@ QuickConverterBot - Запуск бота
 import os
 import sys
 import asyncio
+import logging
 from pathlib import Path
 
 def load_env_file():
@@ -104,6 +105,9 @@ def main():
     print("=" * 50)
     
     try:
+        # Логи: статистика тиков уведомлений и события aiogram
+        logging.basicConfig(level=logging.INFO, format="%(asctime)s %(levelname)s %(name)s: %(message)s")
+        logging.getLogger("httpx").setLevel(logging.WARNING)
         # Импортируем и запускаем бота
         from src.bot import run_bot
         asyncio.run(run_bot())
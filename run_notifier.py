@@ -0,0 +1,70 @@
+#!/usr/bin/env python3
+"""
+QuickConverterBot - отдельные процессы уведомлений
+
+Запуск N воркеров, каждый обслуживает свою часть подписок:
+    python run_notifier.py --shards 4
+Один конкретный шард (например, под systemd/supervisor):
+    python run_notifier.py --shards 4 --shard 2
+
+Бот при этом запускают с NOTIFIER_IN_BOT=0, чтобы уведомления не дублировались.
+"""
+import argparse
+import asyncio
+import logging
+import multiprocessing
+import os
+import sys
+
+from run_bot import check_dependencies, load_env_file, validate_token
+
+
+def run_shard(shard: int, shards: int):
+    """Запускает один шард в текущем процессе"""
+    from src.scheduler import run_notifier_worker
+    logging.basicConfig(
+        level=logging.INFO, format=f"%(asctime)s %(levelname)s notifier-{shard}: %(message)s"
+    )
+    logging.getLogger("httpx").setLevel(logging.WARNING)
+    try:
+        asyncio.run(run_notifier_worker(shard, shards))
+    except KeyboardInterrupt:
+        pass
+
+def main():
+    """Основная функция"""
+    parser = argparse.ArgumentParser(description="QuickConverterBot notifier workers")
+    parser.add_argument("--shards", type=int, default=int(os.getenv("NOTIFIER_SHARDS", "1")), help="всего шардов")
+    parser.add_argument("--shard", type=int, help="запустить только этот шард (0..shards-1)")
+    args = parser.parse_args()
+
+    if not load_env_file() or not validate_token() or not check_dependencies():
+        return 1
+    if args.shards < 1 or (args.shard is not None and not 0 <= args.shard < args.shards):
+        print("❌ Неверные --shard/--shards")
+        return 1
+
+    if args.shard is not None:
+        print(f"🔔 Шард уведомлений {args.shard + 1}/{args.shards}")
+        run_shard(args.shard, args.shards)
+        return 0
+
+    print(f"🔔 Запуск {args.shards} процессов уведомлений...")
+    print("💡 Для остановки нажми Ctrl+C")
+    workers = [
+        multiprocessing.Process(target=run_shard, args=(shard, args.shards), name=f"notifier-{shard}")
+        for shard in range(args.shards)
+    ]
+    for w in workers:
+        w.start()
+    try:
+        for w in workers:
+            w.join()
+    except KeyboardInterrupt:
+        print("\n👋 Уведомления остановлены пользователем")
+        for w in workers:
+            w.join(timeout=10)
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,300 @@
+from __future__ import annotations
+
+import math
+from array import array
+from bisect import bisect_left, bisect_right
+from heapq import merge
+from itertools import groupby
+from typing import Dict, Iterable, List, Tuple
+
+
+EPSILON = 1e-12
+# С этого числа подписок колонка перестраивается одним проходом, а не вставками по одной
+BULK_MOVE = 64
+
+
+def compare(value: float, op: str, threshold: float) -> bool:
+    if op == ">":
+        return value > threshold
+    if op == ">=":
+        return value >= threshold
+    if op == "<":
+        return value < threshold
+    if op == "<=":
+        return value <= threshold
+    if op == "==":
+        return abs(value - threshold) < EPSILON
+    return False
+
+
+def rearmed(value: float, op: str, threshold: float, hysteresis: float) -> bool:
+    """Ушёл ли курс обратно за порог с запасом ``hysteresis`` (доля от порога)."""
+    margin = abs(threshold) * hysteresis
+    if op in (">", ">="):
+        return not compare(value, op, threshold - margin)
+    if op in ("<", "<="):
+        return not compare(value, op, threshold + margin)
+    if op == "==":
+        return abs(value - threshold) > max(margin, EPSILON)
+    return True
+
+
+def _hold_bound(value: float, positive: float, negative: float) -> float:
+    # Порог t, при котором t -/+ |t|*h == value: делитель зависит от знака (функция монотонна при h < 1)
+    return value / (positive if value >= 0 else negative)
+
+
+def rearm_bounds(op: str, value: float, hysteresis: float) -> Tuple[float, float]:
+    """Пороги сработавших подписок, которые могут взвестись при курсе ``value``.
+
+    Возвращает (lo, hi): подписки с ``lo < threshold < hi`` точно остаются
+    сработавшими, остальные (``threshold <= lo`` или ``threshold >= hi``)
+    проверяет ``rearmed``. Границы взяты с запасом на округление, поэтому
+    кандидатов бывает на пару больше, но не меньше.
+    """
+    if not 0 <= hysteresis < 1:
+        return -math.inf, -math.inf
+    h = hysteresis
+    if op in (">", ">="):
+        lo, hi = -math.inf, _hold_bound(value, 1 - h, 1 + h)
+    elif op in ("<", "<="):
+        lo, hi = _hold_bound(value, 1 + h, 1 - h), math.inf
+    elif op == "==":
+        a, b = sorted((_hold_bound(value, 1 + h, 1 - h), _hold_bound(value, 1 - h, 1 + h)))
+        lo, hi = min(a, value - EPSILON), max(b, value + EPSILON)
+    else:
+        return -math.inf, -math.inf
+    lo += abs(lo) * 1e-12 if math.isfinite(lo) else 0.0
+    hi -= abs(hi) * 1e-12 if math.isfinite(hi) else 0.0
+    if lo >= hi:
+        # Запас съел весь интервал: проверяются все
+        return -math.inf, -math.inf
+    return lo, hi
+
+
+def evaluate_crossings(
+    matching: Iterable[dict], triggered: Iterable[dict], value: float, now: float,
+    hysteresis: float = 0.0, cooldown: float = 0.0,
+) -> Tuple[List[dict], List[dict]]:
+    """Переходы состояния: (сработавшие сейчас, снова взведённые).
+
+    ``matching`` - ещё не сработавшие подписки, чьё условие выполняется при
+    курсе ``value``; ``triggered`` - уже сработавшие (достаточно кандидатов
+    из ``rearm_bounds``). Подписка срабатывает не чаще раза в ``cooldown``
+    секунд и взводится обратно, когда курс уходит за порог с запасом
+    ``hysteresis``. Меняются сами словари подписок.
+    """
+    fired: List[dict] = []
+    for sub in matching:
+        last = sub.get("last_fired_at")
+        if last is not None and now - last < cooldown:
+            continue
+        sub["triggered"] = 1
+        sub["last_fired_at"] = now
+        fired.append(sub)
+    rearmed_subs: List[dict] = []
+    for sub in triggered:
+        if rearmed(value, sub["operator"], sub["threshold"], hysteresis):
+            sub["triggered"] = 0
+            rearmed_subs.append(sub)
+    return fired, rearmed_subs
+
+
+def _threshold(item: Tuple[float, int]) -> float:
+    return item[0]
+
+
+def _column_key(sub: dict) -> Tuple[str, str, str]:
+    return sub["base"], sub["quote"], sub["operator"]
+
+
+class _Column:
+    """Пороги одного (base, quote, operator), отсортированные по значению."""
+
+    __slots__ = ("thresholds", "ids")
+
+    def __init__(self, items: Iterable[Tuple[float, int]] = ()) -> None:
+        self._fill(items)
+
+    def _fill(self, items: Iterable[Tuple[float, int]]) -> None:
+        # items - пары (threshold, id), уже отсортированные по порогу
+        items = list(items)
+        self.thresholds = array("d", [t for t, _ in items])
+        self.ids = array("q", [i for _, i in items])
+
+    def __len__(self) -> int:
+        return len(self.ids)
+
+    def add_many(self, items: List[Tuple[float, int]]) -> None:
+        if len(items) < BULK_MOVE:
+            for threshold, sub_id in items:
+                self.add(sub_id, threshold)
+            return
+        # Слияние двух отсортированных последовательностей; равные пороги - после уже лежащих, как в add
+        items.sort(key=_threshold)
+        self._fill(merge(zip(self.thresholds, self.ids), items, key=_threshold))
+
+    def remove_many(self, items: List[Tuple[float, int]]) -> None:
+        if len(items) < BULK_MOVE:
+            for threshold, sub_id in items:
+                self.remove(sub_id, threshold)
+            return
+        drop = {sub_id for _, sub_id in items}
+        self._fill([(t, i) for t, i in zip(self.thresholds, self.ids) if i not in drop])
+
+    def add(self, sub_id: int, threshold: float) -> None:
+        pos = bisect_right(self.thresholds, threshold)
+        self.thresholds.insert(pos, threshold)
+        self.ids.insert(pos, sub_id)
+
+    def remove(self, sub_id: int, threshold: float) -> bool:
+        lo = bisect_left(self.thresholds, threshold)
+        hi = bisect_right(self.thresholds, threshold)
+        for pos in range(lo, hi):
+            if self.ids[pos] == sub_id:
+                del self.thresholds[pos]
+                del self.ids[pos]
+                return True
+        return False
+
+    def matching(self, op: str, value: float) -> array:
+        # Условие "value op threshold" выполняется на непрерывном отрезке отсортированных порогов
+        thr = self.thresholds
+        if op == ">":
+            return self.ids[: bisect_left(thr, value)]
+        if op == ">=":
+            return self.ids[: bisect_right(thr, value)]
+        if op == "<":
+            return self.ids[bisect_right(thr, value):]
+        if op == "<=":
+            return self.ids[bisect_left(thr, value):]
+        if op == "==":
+            return self.ids[bisect_right(thr, value - EPSILON): bisect_left(thr, value + EPSILON)]
+        return array("q")
+
+    def outside(self, lo: float, hi: float) -> array:
+        # Пороги <= lo и >= hi (lo < hi) - два среза по краям колонки
+        thr = self.thresholds
+        return self.ids[: bisect_right(thr, lo)] + self.ids[bisect_left(thr, hi):]
+
+
+class AlertIndex:
+    """Индекс подписок: по паре и оператору, с бинарным поиском по порогу.
+
+    Взведённые и сработавшие подписки лежат в разных колонках, поэтому
+    ``crossings`` находит и новые срабатывания, и кандидатов на обратное
+    взведение за O(log n + k), не трогая подписки далеко от порога - в том
+    числе те, чьё условие держится выполненным долго.
+    """
+
+    def __init__(self) -> None:
+        # Взведённые подписки: ждут, когда условие выполнится
+        self._pairs: Dict[Tuple[str, str], Dict[str, _Column]] = {}
+        # Сработавшие подписки: ждут обратного пересечения порога
+        self._triggered: Dict[Tuple[str, str], Dict[str, _Column]] = {}
+        self._subs: Dict[int, dict] = {}
+
+    def __len__(self) -> int:
+        return len(self._subs)
+
+    def __contains__(self, sub_id: int) -> bool:
+        return sub_id in self._subs
+
+    def ids(self) -> Iterable[int]:
+        return self._subs.keys()
+
+    def get(self, sub_id: int) -> dict:
+        return self._subs[sub_id]
+
+    def pairs(self) -> List[Tuple[str, str]]:
+        return list(dict.fromkeys([*self._pairs, *self._triggered]))
+
+    def count(self, pair: Tuple[str, str]) -> int:
+        return sum(
+            len(column)
+            for columns in (self._pairs, self._triggered)
+            for column in columns.get(pair, {}).values()
+        )
+
+    def _insert(self, sub: dict, triggered: bool) -> None:
+        columns = self._triggered if triggered else self._pairs
+        ops = columns.setdefault((sub["base"], sub["quote"]), {})
+        ops.setdefault(sub["operator"], _Column()).add(sub["id"], sub["threshold"])
+
+    def _discard(self, sub: dict, triggered: bool) -> None:
+        columns = self._triggered if triggered else self._pairs
+        pair = (sub["base"], sub["quote"])
+        column = columns[pair][sub["operator"]]
+        column.remove(sub["id"], sub["threshold"])
+        self._drop_empty(columns, pair, sub["operator"])
+
+    @staticmethod
+    def _drop_empty(columns: Dict[Tuple[str, str], Dict[str, _Column]], pair: Tuple[str, str], op: str) -> None:
+        ops = columns[pair]
+        if not ops[op]:
+            del ops[op]
+        if not ops:
+            del columns[pair]
+
+    def _move(self, subs: List[dict], triggered: bool) -> None:
+        """Перенести подписки в колонки сработавших (``triggered``) или взведённых."""
+        source, target = (self._pairs, self._triggered) if triggered else (self._triggered, self._pairs)
+        for (base, quote, op), group in groupby(sorted(subs, key=_column_key), key=_column_key):
+            items = [(sub["threshold"], sub["id"]) for sub in group]
+            source[(base, quote)][op].remove_many(items)
+            self._drop_empty(source, (base, quote), op)
+            target.setdefault((base, quote), {}).setdefault(op, _Column()).add_many(items)
+
+    def load(self, subs: Iterable[dict]) -> None:
+        """Заменить содержимое индекса: колонки строятся одной сортировкой, а не вставками."""
+        self._pairs, self._triggered, self._subs = {}, {}, {}
+        buckets: Dict[Tuple[bool, str, str, str], List[Tuple[float, int]]] = {}
+        for sub in subs:
+            self._subs[sub["id"]] = sub
+        for sub in self._subs.values():
+            key = (bool(sub.get("triggered")), sub["base"], sub["quote"], sub["operator"])
+            buckets.setdefault(key, []).append((sub["threshold"], sub["id"]))
+        for (triggered, base, quote, op), items in buckets.items():
+            items.sort(key=_threshold)
+            columns = self._triggered if triggered else self._pairs
+            columns.setdefault((base, quote), {})[op] = _Column(items)
+
+    def add(self, sub: dict) -> None:
+        if sub["id"] in self._subs:
+            self.remove(sub["id"])
+        self._subs[sub["id"]] = sub
+        self._insert(sub, bool(sub.get("triggered")))
+
+    def remove(self, sub_id: int) -> None:
+        sub = self._subs.pop(sub_id, None)
+        if sub is not None:
+            self._discard(sub, bool(sub.get("triggered")))
+
+    def matching(self, pair: Tuple[str, str], value: float) -> List[dict]:
+        """Взведённые подписки пары, чьё условие выполняется при курсе ``value``."""
+        result: List[dict] = []
+        for op, column in self._pairs.get(pair, {}).items():
+            result.extend(self._subs[i] for i in column.matching(op, value))
+        return result
+
+    def rearm_candidates(self, pair: Tuple[str, str], value: float, hysteresis: float = 0.0) -> List[dict]:
+        """Сработавшие подписки пары, которые могут взвестись при курсе ``value``."""
+        result: List[dict] = []
+        for op, column in self._triggered.get(pair, {}).items():
+            result.extend(self._subs[i] for i in column.outside(*rearm_bounds(op, value, hysteresis)))
+        return result
+
+    def crossings(
+        self, pair: Tuple[str, str], value: float, now: float, hysteresis: float = 0.0, cooldown: float = 0.0
+    ) -> Tuple[List[dict], List[dict], int]:
+        """Пересечения порогов пары, см. ``evaluate_crossings``; состояние нужно сохранить в БД.
+
+        Третий элемент - число проверенных подписок (кандидатов из индекса).
+        """
+        matching = self.matching(pair, value)
+        candidates = self.rearm_candidates(pair, value, hysteresis)
+        fired, rearmed_subs = evaluate_crossings(matching, candidates, value, now, hysteresis, cooldown)
+        # Переносим подписки между колонками взведённых и сработавших
+        self._move(fired, triggered=True)
+        self._move(rearmed_subs, triggered=False)
+        return fired, rearmed_subs, len(matching) + len(candidates)
@@ -1,5 +1,6 @@
 from __future__ import annotations
 import asyncio
+from datetime import datetime
 from aiogram import Bot, Dispatcher, F
 from aiogram.filters import Command
 from aiogram.types import Message, CallbackQuery, InlineKeyboardMarkup, InlineKeyboardButton
@@ -7,7 +8,8 @@ from .config import get_settings
 from .rates import RatesService
 from .parser import parse_convert, parse_alert
 from .db import Database
-from .scheduler import run_notifier
+from .history import RateHistory
+from .scheduler import run_notifier, run_rates_refresher
 from .keyboards import get_main_keyboard, get_currency_keyboard, get_operator_keyboard
 
 user_states = {} 
@@ -46,9 +48,18 @@ async def create_app():
     settings = get_settings()
     bot = Bot(token=settings.bot_token)
     dp = Dispatcher()
-    db = Database(settings.database_path)
+    db = Database.from_settings(settings)
     await db.init()
-    rates = RatesService(user_agent=settings.user_agent)
+    rates = RatesService.from_settings(settings)
+    usd_values, updated_at, currency_times = await db.load_rate_snapshot()
+    if updated_at is not None:
+        rates.restore_matrix(usd_values, updated_at, currency_times)
+
+    def stale_note(*currencies: str) -> str:
+        stale_since = rates.stale_since(*currencies)
+        if stale_since is None:
+            return ""
+        return f"\n\n⚠️ Источники курсов недоступны, курс от {datetime.fromtimestamp(stale_since):%d.%m %H:%M}"
 
     # --- Клавиатура для удаления подписки ---
     from aiogram.utils.keyboard import InlineKeyboardBuilder
@@ -237,28 +248,28 @@ async def create_app():
             rate = await rates.get_rate("USD", "EUR")
             if rate:
                 result = 100 * rate
-                text = f"💱 <b>100 USD → EUR</b>\n\n💵 100 USD = {result:.2f} EUR\n📊 Курс: 1 USD = {rate:.4f} EUR"
+                text = f"💱 <b>100 USD → EUR</b>\n\n💵 100 USD = {result:.2f} EUR\n📊 Курс: 1 USD = {rate:.4f} EUR" + stale_note("USD", "EUR")
             else:
                 text = "❌ Не удалось получить курс USD/EUR"
         elif data == "quick_btc_usd":
             rate = await rates.get_rate("BTC", "USD")
             if rate:
                 result = 1 * rate
-                text = f"💱 <b>1 BTC → USD</b>\n\n₿ 1 BTC = ${result:,.2f}\n📊 Курс: 1 BTC = ${rate:,.2f}"
+                text = f"💱 <b>1 BTC → USD</b>\n\n₿ 1 BTC = ${result:,.2f}\n📊 Курс: 1 BTC = ${rate:,.2f}" + stale_note("BTC", "USD")
             else:
                 text = "❌ Не удалось получить курс BTC/USD"
         elif data == "quick_eth_usd":
             rate = await rates.get_rate("ETH", "USD")
             if rate:
                 result = 1 * rate
-                text = f"💱 <b>1 ETH → USD</b>\n\n⚡ 1 ETH = ${result:,.2f}\n📊 Курс: 1 ETH = ${rate:,.2f}"
+                text = f"💱 <b>1 ETH → USD</b>\n\n⚡ 1 ETH = ${result:,.2f}\n📊 Курс: 1 ETH = ${rate:,.2f}" + stale_note("ETH", "USD")
             else:
                 text = "❌ Не удалось получить курс ETH/USD"
         elif data == "quick_sol_usd":
             rate = await rates.get_rate("SOL", "USD")
             if rate:
                 result = 1 * rate
-                text = f"💱 <b>1 SOL → USD</b>\n\n💎 1 SOL = ${result:.2f}\n📊 Курс: 1 SOL = ${rate:.4f}"
+                text = f"💱 <b>1 SOL → USD</b>\n\n💎 1 SOL = ${result:.2f}\n📊 Курс: 1 SOL = ${rate:.4f}" + stale_note("SOL", "USD")
             else:
                 text = "❌ Не удалось получить курс SOL/USD"
         else:
@@ -399,7 +410,7 @@ async def create_app():
             await message.answer(
                 f"💱 <b>Конвертация завершена!</b>\n\n"
                 f"📊 <b>Курс:</b> 1 {base} = {rate:.6g} {quote}\n"
-                f"💵 <b>Результат:</b> {amount} {base} = {result:.6g} {quote}",
+                f"💵 <b>Результат:</b> {amount} {base} = {result:.6g} {quote}" + stale_note(base, quote),
                 parse_mode="HTML",
                 reply_markup=get_main_keyboard()
             )
@@ -440,7 +451,7 @@ async def create_app():
                 f"💱 <b>Конвертация завершена!</b>\n\n"
                 f"📊 <b>Курс:</b> 1 {cq.base} = {rate:.6g} {cq.quote}\n"
                 f"💵 <b>Результат:</b> {cq.amount} {cq.base} = {result:.6g} {cq.quote}\n\n"
-                f"🔄 <b>Хочешь еще?</b>"
+                f"🔄 <b>Хочешь еще?</b>" + stale_note(cq.base, cq.quote)
             )
             await message.answer(convert_text, parse_mode="HTML", reply_markup=get_main_keyboard())
             return
@@ -458,13 +469,20 @@ async def create_app():
 
 async def run_bot():
     bot, dp, db, rates = await create_app()
-    notifier_task = asyncio.create_task(run_notifier(bot, db, rates))
+    settings = get_settings()
+    history = RateHistory.from_settings(db, settings) if settings.rate_history else None
+    tasks = [asyncio.create_task(run_rates_refresher(rates, db, history))]
+    if settings.notifier_in_bot:
+        # Иначе уведомления рассылают отдельные процессы run_notifier.py
+        tasks.append(asyncio.create_task(run_notifier(bot, db, rates)))
     try:
         await dp.start_polling(bot)
     finally:
-        notifier_task.cancel()
-        try:
-            await notifier_task
-        except Exception:
-            pass
-        await rates.close()
\ No newline at end of file
+        for task in tasks:
+            task.cancel()
+            try:
+                await task
+            except (asyncio.CancelledError, Exception):
+                pass
+        await rates.close()
+        await db.close()
\ No newline at end of file
@@ -0,0 +1,132 @@
+from __future__ import annotations
+
+import asyncio
+import time
+from collections import OrderedDict
+from dataclasses import dataclass, field
+from typing import Awaitable, Callable, Dict, Generic, Hashable, Optional, Tuple, TypeVar
+
+
+T = TypeVar("T")
+
+
+@dataclass
+class Snapshot:
+    rates: Dict[str, float]
+    fetched_at: float = field(default_factory=time.monotonic)
+
+    def age(self) -> float:
+        return time.monotonic() - self.fetched_at
+
+
+class SnapshotCache:
+    """LRU-кэш таблиц курсов по базовой валюте.
+
+    Снимок свежий в течение ``ttl`` секунд, затем ещё ``stale_ttl`` секунд
+    его можно отдавать, пока идёт фоновое обновление (stale-while-revalidate).
+    """
+
+    def __init__(self, ttl: float, stale_ttl: float, max_size: int) -> None:
+        self._ttl = ttl
+        self._stale_ttl = stale_ttl
+        self._max_size = max(1, max_size)
+        self._items: "OrderedDict[str, Snapshot]" = OrderedDict()
+
+    def __len__(self) -> int:
+        return len(self._items)
+
+    def get(self, key: str) -> Optional[Snapshot]:
+        snap = self._items.get(key)
+        if snap is None:
+            return None
+        if snap.age() > self._ttl + self._stale_ttl:
+            del self._items[key]
+            return None
+        self._items.move_to_end(key)
+        return snap
+
+    def is_fresh(self, snap: Snapshot) -> bool:
+        return snap.age() <= self._ttl
+
+    def put(self, key: str, rates: Dict[str, float]) -> Snapshot:
+        snap = Snapshot(rates=rates)
+        self._items[key] = snap
+        self._items.move_to_end(key)
+        while len(self._items) > self._max_size:
+            self._items.popitem(last=False)
+        return snap
+
+
+class TTLCache(Generic[T]):
+    """Ограниченный LRU-кэш с временем жизни записи и счётчиками попаданий.
+
+    ``invalidate`` увеличивает ``generation``: ``put`` с поколением, взятым
+    до чтения из источника, не запишет результат, устаревший из-за
+    параллельной записи.
+    """
+
+    def __init__(self, ttl: float, max_size: int) -> None:
+        self._ttl = ttl
+        self._max_size = max(1, max_size)
+        self._items: "OrderedDict[Hashable, Tuple[float, T]]" = OrderedDict()
+        self.generation = 0
+        self.hits = 0
+        self.misses = 0
+
+    def __len__(self) -> int:
+        return len(self._items)
+
+    def get(self, key: Hashable) -> Optional[T]:
+        item = self._items.get(key)
+        if item is None or time.monotonic() - item[0] > self._ttl:
+            if item is not None:
+                del self._items[key]
+            self.misses += 1
+            return None
+        self._items.move_to_end(key)
+        self.hits += 1
+        return item[1]
+
+    def put(self, key: Hashable, value: T, generation: Optional[int] = None) -> None:
+        if generation is not None and generation != self.generation:
+            return
+        self._items[key] = (time.monotonic(), value)
+        self._items.move_to_end(key)
+        while len(self._items) > self._max_size:
+            self._items.popitem(last=False)
+
+    def invalidate(self, key: Hashable) -> None:
+        self.generation += 1
+        self._items.pop(key, None)
+
+    def clear(self) -> None:
+        self.generation += 1
+        self._items.clear()
+
+    def stats(self) -> Dict[str, int]:
+        return {"size": len(self._items), "hits": self.hits, "misses": self.misses}
+
+
+class SingleFlight:
+    """Склеивает одновременные одинаковые запросы в один общий."""
+
+    def __init__(self) -> None:
+        self._calls: Dict[str, asyncio.Task] = {}
+
+    def in_flight(self, key: str) -> bool:
+        return key in self._calls
+
+    async def do(self, key: str, fn: Callable[[], Awaitable[T]]) -> T:
+        task = self._calls.get(key)
+        if task is None:
+            task = asyncio.ensure_future(fn())
+            self._calls[key] = task
+            task.add_done_callback(lambda t: self._forget(key, t))
+        # shield: отмена одного ожидающего не должна отменять общий запрос
+        return await asyncio.shield(task)
+
+    def _forget(self, key: str, task: asyncio.Task) -> None:
+        if self._calls.get(key) is task:
+            del self._calls[key]
+        if not task.cancelled():
+            task.exception()
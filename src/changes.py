@@ -0,0 +1,53 @@
+from __future__ import annotations
+
+import asyncio
+from typing import Dict, Iterable, Set, Tuple
+
+from .matrix import RateMatrix
+
+
+Pair = Tuple[str, str]
+
+
+class RateChangeFeed:
+    """События изменения курса по парам, на которые подписан потребитель.
+
+    RatesService вызывает ``publish`` после каждого обновления матрицы;
+    пара попадает в событие, только если курс сдвинулся больше чем на
+    ``epsilon`` (доля от прошлого значения) или ещё ни разу не публиковался.
+    """
+
+    def __init__(self, epsilon: float = 0.0) -> None:
+        self._epsilon = epsilon
+        self._watched: Set[Pair] = set()
+        self._last: Dict[Pair, float] = {}
+        self._changed: Dict[Pair, float] = {}
+        self._event = asyncio.Event()
+
+    def watch(self, pairs: Iterable[Pair]) -> None:
+        self._watched = set(pairs)
+        for pair in [p for p in self._last if p not in self._watched]:
+            del self._last[pair]
+
+    def publish(self, matrix: RateMatrix) -> None:
+        for pair in self._watched:
+            value = matrix.rate(*pair)
+            if value is None:
+                continue
+            last = self._last.get(pair)
+            if last is not None and abs(value - last) <= self._epsilon * abs(last):
+                continue
+            self._last[pair] = value
+            self._changed[pair] = value
+        if self._changed:
+            self._event.set()
+
+    async def wait(self, timeout: float) -> Dict[Pair, float]:
+        """Изменившиеся пары с новыми курсами; пустой словарь, если за timeout ничего не пришло."""
+        try:
+            await asyncio.wait_for(self._event.wait(), timeout)
+        except asyncio.TimeoutError:
+            pass
+        self._event.clear()
+        changed, self._changed = self._changed, {}
+        return changed
@@ -14,8 +14,52 @@ load_dotenv()
 class Settings:
     bot_token: str
     database_path: str = "data/db.sqlite3"
+    db_read_connections: int = 4
+    db_cache_size_kb: int = 16384
+    db_mmap_size_mb: int = 64
+    db_group_commit_ms: float = 0.0
+    subs_cache_size: int = 10000
+    subs_cache_ttl_seconds: float = 300
     scheduler_interval_seconds: int = 60
+    notifier_rate_concurrency: int = 8
+    notifier_mode: str = "event"
+    rate_change_epsilon: float = 0.0
+    notifier_in_bot: bool = True
+    notifier_shard_key: str = "user"
+    notifier_matching: str = "memory"
+    alert_hysteresis: float = 0.0
+    alert_cooldown_seconds: int = 0
+    delivery_workers: int = 8
+    delivery_global_rate: float = 30.0
+    delivery_per_chat_rate: float = 1.0
+    delivery_queue_size: int = 10000
+    delivery_max_retries: int = 3
+    digest_window_seconds: float = 0.0
     user_agent: str = "QuickConverterBot/1.0"
+    rates_cache_ttl_seconds: int = 60
+    rates_cache_stale_seconds: int = 300
+    rates_cache_size: int = 64
+    rates_refresh_interval_seconds: int = 30
+    rate_history: bool = True
+    rate_history_raw_hours: float = 48
+    rate_history_minute_days: float = 7
+    rate_history_hour_days: float = 730
+    rate_history_day_days: float = 0
+    provider_failure_threshold: int = 3
+    provider_reset_seconds: int = 60
+    http_max_connections: int = 20
+    http_max_keepalive: int = 10
+    http_connect_timeout: float = 3.0
+    http_read_timeout: float = 10.0
+    http2: bool = False
+    http_conditional_requests: bool = True
+
+
+def _env_bool(name: str, default: bool) -> bool:
+    value = os.getenv(name)
+    if value is None:
+        return default
+    return value.strip().lower() in ("1", "true", "yes", "on")
 
 
 def get_settings() -> Settings:
@@ -23,8 +67,83 @@ def get_settings() -> Settings:
     if not token:
         raise RuntimeError("BOT_TOKEN не задан в переменных окружения (.env)")
     db_path = os.getenv("DATABASE_PATH", "data/db.sqlite3")
+    db_read_connections = int(os.getenv("DB_READ_CONNECTIONS", "4"))
+    db_cache_size_kb = int(os.getenv("DB_CACHE_SIZE_KB", "16384"))
+    db_mmap_size_mb = int(os.getenv("DB_MMAP_SIZE_MB", "64"))
+    db_group_commit_ms = float(os.getenv("DB_GROUP_COMMIT_MS", "0"))
+    subs_cache_size = int(os.getenv("SUBS_CACHE_SIZE", "10000"))
+    subs_cache_ttl = float(os.getenv("SUBS_CACHE_TTL_SECONDS", "300"))
     interval = int(os.getenv("SCHEDULER_INTERVAL_SECONDS", "60"))
+    notifier_concurrency = int(os.getenv("NOTIFIER_RATE_CONCURRENCY", "8"))
+    notifier_mode = os.getenv("NOTIFIER_MODE", "event").strip().lower()
+    rate_change_epsilon = float(os.getenv("RATE_CHANGE_EPSILON", "0"))
+    shard_key = os.getenv("NOTIFIER_SHARD_KEY", "user").strip().lower()
+    notifier_matching = os.getenv("NOTIFIER_MATCHING", "memory").strip().lower()
+    alert_hysteresis = float(os.getenv("ALERT_HYSTERESIS", "0"))
+    alert_cooldown = int(os.getenv("ALERT_COOLDOWN_SECONDS", "0"))
+    delivery_workers = int(os.getenv("DELIVERY_WORKERS", "8"))
+    delivery_global_rate = float(os.getenv("DELIVERY_GLOBAL_RATE", "30"))
+    delivery_per_chat_rate = float(os.getenv("DELIVERY_PER_CHAT_RATE", "1"))
+    delivery_queue_size = int(os.getenv("DELIVERY_QUEUE_SIZE", "10000"))
+    delivery_max_retries = int(os.getenv("DELIVERY_MAX_RETRIES", "3"))
+    digest_window = float(os.getenv("DIGEST_WINDOW_SECONDS", "0"))
     user_agent = os.getenv("USER_AGENT", "QuickConverterBot/1.0")
-    return Settings(bot_token=token, database_path=db_path, scheduler_interval_seconds=interval, user_agent=user_agent)
+    cache_ttl = int(os.getenv("RATES_CACHE_TTL_SECONDS", "60"))
+    cache_stale = int(os.getenv("RATES_CACHE_STALE_SECONDS", "300"))
+    cache_size = int(os.getenv("RATES_CACHE_SIZE", "64"))
+    refresh_interval = int(os.getenv("RATES_REFRESH_INTERVAL_SECONDS", "30"))
+    history_raw_hours = float(os.getenv("RATE_HISTORY_RAW_HOURS", "48"))
+    history_minute_days = float(os.getenv("RATE_HISTORY_MINUTE_DAYS", "7"))
+    history_hour_days = float(os.getenv("RATE_HISTORY_HOUR_DAYS", "730"))
+    history_day_days = float(os.getenv("RATE_HISTORY_DAY_DAYS", "0"))
+    failure_threshold = int(os.getenv("PROVIDER_FAILURE_THRESHOLD", "3"))
+    reset_seconds = int(os.getenv("PROVIDER_RESET_SECONDS", "60"))
+    max_connections = int(os.getenv("HTTP_MAX_CONNECTIONS", "20"))
+    max_keepalive = int(os.getenv("HTTP_MAX_KEEPALIVE", "10"))
+    connect_timeout = float(os.getenv("HTTP_CONNECT_TIMEOUT", "3"))
+    read_timeout = float(os.getenv("HTTP_READ_TIMEOUT", "10"))
+    return Settings(
+        bot_token=token,
+        database_path=db_path,
+        db_read_connections=db_read_connections,
+        db_cache_size_kb=db_cache_size_kb,
+        db_mmap_size_mb=db_mmap_size_mb,
+        db_group_commit_ms=db_group_commit_ms,
+        subs_cache_size=subs_cache_size,
+        subs_cache_ttl_seconds=subs_cache_ttl,
+        scheduler_interval_seconds=interval,
+        notifier_rate_concurrency=notifier_concurrency,
+        notifier_mode=notifier_mode,
+        rate_change_epsilon=rate_change_epsilon,
+        notifier_in_bot=_env_bool("NOTIFIER_IN_BOT", True),
+        notifier_shard_key=shard_key,
+        notifier_matching=notifier_matching,
+        alert_hysteresis=alert_hysteresis,
+        alert_cooldown_seconds=alert_cooldown,
+        delivery_workers=delivery_workers,
+        delivery_global_rate=delivery_global_rate,
+        delivery_per_chat_rate=delivery_per_chat_rate,
+        delivery_queue_size=delivery_queue_size,
+        delivery_max_retries=delivery_max_retries,
+        digest_window_seconds=digest_window,
+        user_agent=user_agent,
+        rates_cache_ttl_seconds=cache_ttl,
+        rates_cache_stale_seconds=cache_stale,
+        rates_cache_size=cache_size,
+        rates_refresh_interval_seconds=refresh_interval,
+        rate_history=_env_bool("RATE_HISTORY", True),
+        rate_history_raw_hours=history_raw_hours,
+        rate_history_minute_days=history_minute_days,
+        rate_history_hour_days=history_hour_days,
+        rate_history_day_days=history_day_days,
+        provider_failure_threshold=failure_threshold,
+        provider_reset_seconds=reset_seconds,
+        http_max_connections=max_connections,
+        http_max_keepalive=max_keepalive,
+        http_connect_timeout=connect_timeout,
+        http_read_timeout=read_timeout,
+        http2=_env_bool("HTTP2", False),
+        http_conditional_requests=_env_bool("HTTP_CONDITIONAL_REQUESTS", True),
+    )
 
 
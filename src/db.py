@@ -1,7 +1,14 @@
 from __future__ import annotations
 
+import asyncio
+from contextlib import asynccontextmanager
+from typing import Any, AsyncIterator, Dict, Iterable, List, NamedTuple, Optional, Tuple
+
 import aiosqlite
 
+from .alerts import EPSILON, rearm_bounds
+from .cache import TTLCache
+
 
 CREATE_SQL = """
 CREATE TABLE IF NOT EXISTS subscriptions (
@@ -10,72 +17,552 @@ CREATE TABLE IF NOT EXISTS subscriptions (
     base TEXT NOT NULL,
     quote TEXT NOT NULL,
     operator TEXT NOT NULL,
-    threshold REAL NOT NULL
+    threshold REAL NOT NULL,
+    triggered INTEGER NOT NULL DEFAULT 0,
+    last_fired_at REAL
 );
 CREATE INDEX IF NOT EXISTS idx_subscriptions_user ON subscriptions(user_id);
-CREATE INDEX IF NOT EXISTS idx_subscriptions_pair ON subscriptions(base, quote);
+CREATE TABLE IF NOT EXISTS subscription_changes (
+    version INTEGER PRIMARY KEY AUTOINCREMENT,
+    subscription_id INTEGER NOT NULL
+);
+CREATE TRIGGER IF NOT EXISTS trg_subscriptions_insert AFTER INSERT ON subscriptions BEGIN
+    INSERT INTO subscription_changes(subscription_id) VALUES (NEW.id);
+END;
+CREATE TRIGGER IF NOT EXISTS trg_subscriptions_delete AFTER DELETE ON subscriptions BEGIN
+    INSERT INTO subscription_changes(subscription_id) VALUES (OLD.id);
+END;
+CREATE TRIGGER IF NOT EXISTS trg_subscriptions_update
+AFTER UPDATE OF user_id, base, quote, operator, threshold ON subscriptions BEGIN
+    INSERT INTO subscription_changes(subscription_id) VALUES (NEW.id);
+END;
+CREATE TABLE IF NOT EXISTS rate_snapshots (
+    currency TEXT PRIMARY KEY,
+    usd REAL NOT NULL,
+    updated_at REAL NOT NULL
+);
+-- История курсов к USD: resolution 0 - сырые точки (только close),
+-- 60/3600/86400 - свечи за минуту/час/день, обновляемые при каждой записи
+CREATE TABLE IF NOT EXISTS rate_history (
+    currency TEXT NOT NULL,
+    resolution INTEGER NOT NULL,
+    bucket INTEGER NOT NULL,
+    close REAL NOT NULL,
+    open REAL,
+    high REAL,
+    low REAL,
+    PRIMARY KEY (currency, resolution, bucket)
+) WITHOUT ROWID;
 """
 
+# Колонки, добавленные после первой версии схемы: (имя, определение)
+MIGRATIONS = [
+    ("triggered", "INTEGER NOT NULL DEFAULT 0"),
+    ("last_fired_at", "REAL"),
+]
+
+# Индексы по колонкам из MIGRATIONS: создаются после ALTER TABLE, иначе старая база не откроется
+# idx_subscriptions_alerts покрывающий: triggered перед порогом - поиск сразу по диапазону
+# нужного состояния, user_id и last_fired_at в индексе - без чтения строк таблицы
+INDEX_SQL = """
+DROP INDEX IF EXISTS idx_subscriptions_pair;
+CREATE INDEX IF NOT EXISTS idx_subscriptions_alerts
+    ON subscriptions(base, quote, operator, triggered, threshold, user_id, last_fired_at);
+"""
+
+INSERT_SUBSCRIPTION_SQL = (
+    "INSERT INTO subscriptions(user_id, base, quote, operator, threshold) VALUES (?, ?, ?, ?, ?)"
+)
+DELETE_SUBSCRIPTION_SQL = "DELETE FROM subscriptions WHERE user_id = ? AND base = ? AND quote = ?"
+
+SUBSCRIPTION_COLUMNS = "id, user_id, base, quote, operator, threshold, triggered, last_fired_at"
+
+# Условие "курс op порог" как диапазон порогов: по одному range scan индекса
+# idx_subscriptions_alerts на оператор
+_MATCH_RANGES = [
+    (">", "threshold < ?"),
+    (">=", "threshold <= ?"),
+    ("<", "threshold > ?"),
+    ("<=", "threshold >= ?"),
+]
+MATCHING_SQL = " UNION ALL ".join(
+    [
+        f"SELECT {SUBSCRIPTION_COLUMNS} FROM subscriptions "
+        f"WHERE base = ? AND quote = ? AND operator = '{op}' AND {cond} AND triggered = 0"
+        for op, cond in _MATCH_RANGES
+    ]
+    + [
+        f"SELECT {SUBSCRIPTION_COLUMNS} FROM subscriptions "
+        "WHERE base = ? AND quote = ? AND operator = '==' AND threshold > ? AND threshold < ? AND triggered = 0"
+    ]
+)
+
+ALERT_OPERATORS = (">", ">=", "<", "<=", "==")
+# Сработавшие подписки, которые могут взвестись: пороги вне интервала из rearm_bounds,
+# по два range scan на оператор вместо всех сработавших подписок пары
+REARM_SQL = " UNION ALL ".join(
+    f"SELECT {SUBSCRIPTION_COLUMNS} FROM subscriptions "
+    f"WHERE base = ? AND quote = ? AND operator = '{op}' AND triggered = 1 AND {cond}"
+    for op in ALERT_OPERATORS
+    for cond in ("threshold <= ?", "threshold >= ?")
+)
+
+
+class Subscription(NamedTuple):
+    """Компактная неизменяемая строка подписки (кортеж вместо словаря на строку).
+
+    Для совместимости со старым кодом поддерживает ``sub["base"]`` и ``sub.get(...)``;
+    ``as_dict()`` даёт изменяемый словарь, как раньше возвращали методы Database.
+    """
+
+    id: int
+    user_id: int
+    base: str
+    quote: str
+    operator: str
+    threshold: float
+    triggered: int = 0
+    last_fired_at: Optional[float] = None
+
+    def __getitem__(self, key):
+        if isinstance(key, str):
+            # Только поля строки: sub["count"] не должен отдавать метод кортежа
+            if key not in self._fields:
+                raise KeyError(key)
+            return getattr(self, key)
+        return tuple.__getitem__(self, key)
+
+    def get(self, key: str, default: Any = None) -> Any:
+        return getattr(self, key) if key in self._fields else default
+
+    def as_dict(self) -> dict:
+        return self._asdict()
+
+
+def _subscription_row(r) -> dict:
+    return {
+        "id": r[0],
+        "user_id": r[1],
+        "base": r[2],
+        "quote": r[3],
+        "operator": r[4],
+        "threshold": r[5],
+        "triggered": r[6],
+        "last_fired_at": r[7],
+    }
+
 
 class Database:
-    def __init__(self, path: str) -> None:
+    """Доступ к SQLite через постоянные соединения.
+
+    Все записи идут через одно соединение-писатель под замком, чтения - через
+    пул из ``readers`` соединений. В режиме WAL читатели не блокируют
+    писателя и друг друга, а соединения открываются один раз при ``init``
+    и закрываются в ``close``.
+
+    С ``group_commit_ms > 0`` одиночные записи из хендлеров копятся столько
+    миллисекунд и фиксируются одной транзакцией; вызывающий по-прежнему
+    ждёт коммита своей записи.
+    """
+
+    def __init__(
+        self,
+        path: str,
+        readers: int = 4,
+        cache_size_kb: int = 16384,
+        mmap_size_mb: int = 64,
+        group_commit_ms: float = 0,
+        subs_cache_size: int = 10000,
+        subs_cache_ttl: float = 300,
+    ) -> None:
         self._path = path
+        self._readers_count = max(1, readers)
+        self._cache_size_kb = cache_size_kb
+        self._mmap_size_mb = mmap_size_mb
+        self._writer: Optional[aiosqlite.Connection] = None
+        self._write_lock = asyncio.Lock()
+        self._readers: "asyncio.Queue[aiosqlite.Connection]" = asyncio.Queue()
+        self._reader_conns: List[aiosqlite.Connection] = []
+        self._open_lock = asyncio.Lock()
+        self._group_window = group_commit_ms / 1000
+        self._pending: List[Tuple[str, tuple, asyncio.Future]] = []
+        self._group_task: Optional[asyncio.Task] = None
+        # Подписки пользователя для меню: сбрасываются при каждой записи этого пользователя
+        self.subs_cache: TTLCache[Tuple[Subscription, ...]] = TTLCache(subs_cache_ttl, subs_cache_size)
+
+    @classmethod
+    def from_settings(cls, settings) -> "Database":
+        return cls(
+            settings.database_path,
+            readers=settings.db_read_connections,
+            cache_size_kb=settings.db_cache_size_kb,
+            mmap_size_mb=settings.db_mmap_size_mb,
+            group_commit_ms=settings.db_group_commit_ms,
+            subs_cache_size=settings.subs_cache_size,
+            subs_cache_ttl=settings.subs_cache_ttl_seconds,
+        )
+
+    async def _connect(self, read_only: bool) -> aiosqlite.Connection:
+        conn = await aiosqlite.connect(self._path)
+        # Отрицательный cache_size - размер в КиБ, а не в страницах
+        await conn.execute(f"PRAGMA cache_size = -{int(self._cache_size_kb)}")
+        await conn.execute(f"PRAGMA mmap_size = {int(self._mmap_size_mb) * 1024 * 1024}")
+        await conn.execute("PRAGMA busy_timeout = 5000")
+        if read_only:
+            await conn.execute("PRAGMA query_only = ON")
+        else:
+            await conn.execute("PRAGMA journal_mode = WAL")
+            # В WAL режим NORMAL не теряет целостность, только последние коммиты при сбое ОС
+            await conn.execute("PRAGMA synchronous = NORMAL")
+        return conn
+
+    async def _open(self) -> None:
+        async with self._open_lock:
+            if self._writer is not None:
+                return
+            writer = await self._connect(read_only=False)
+            for _ in range(self._readers_count):
+                conn = await self._connect(read_only=True)
+                self._reader_conns.append(conn)
+                self._readers.put_nowait(conn)
+            self._writer = writer
+
+    async def close(self) -> None:
+        if self._group_task is not None:
+            await self._group_task
+        async with self._open_lock:
+            if self._writer is None:
+                return
+            async with self._write_lock:
+                await self._writer.close()
+                self._writer = None
+            for conn in self._reader_conns:
+                await conn.close()
+            self._reader_conns = []
+            self._readers = asyncio.Queue()
+
+    @asynccontextmanager
+    async def _write(self) -> AsyncIterator[aiosqlite.Connection]:
+        """Соединение-писатель; изменения фиксируются при выходе, при ошибке откатываются."""
+        if self._writer is None:
+            await self._open()
+        async with self._write_lock:
+            try:
+                yield self._writer
+            except BaseException:
+                await self._writer.rollback()
+                raise
+            await self._writer.commit()
+
+    @asynccontextmanager
+    async def _read(self) -> AsyncIterator[aiosqlite.Connection]:
+        if self._writer is None:
+            await self._open()
+        conn = await self._readers.get()
+        try:
+            yield conn
+        finally:
+            if conn.in_transaction:
+                # Не возвращаем в пул соединение с открытым снимком чтения
+                await conn.rollback()
+            self._readers.put_nowait(conn)
+
+    async def _execute_write(self, sql: str, params: tuple) -> int:
+        """Одиночная запись; возвращает rowcount. При group commit - в общей транзакции."""
+        if self._group_window <= 0:
+            async with self._write() as db:
+                cur = await db.execute(sql, params)
+                return cur.rowcount or 0
+        future = asyncio.get_running_loop().create_future()
+        self._pending.append((sql, params, future))
+        if self._group_task is None:
+            self._group_task = asyncio.create_task(self._group_commit())
+        return await future
+
+    async def _group_commit(self) -> None:
+        await asyncio.sleep(self._group_window)
+        batch, self._pending = self._pending, []
+        self._group_task = None
+        results: List[Tuple[asyncio.Future, Optional[int], Optional[BaseException]]] = []
+        try:
+            async with self._write() as db:
+                for sql, params, future in batch:
+                    # Ошибка одного оператора откатывает только его, транзакция остаётся
+                    try:
+                        cur = await db.execute(sql, params)
+                        results.append((future, cur.rowcount or 0, None))
+                    except Exception as e:
+                        results.append((future, None, e))
+        except Exception as e:
+            results = [(future, None, e) for _, _, future in batch]
+        for future, rowcount, error in results:
+            if future.done():
+                continue
+            if error is not None:
+                future.set_exception(error)
+            else:
+                future.set_result(rowcount)
 
     async def init(self) -> None:
-        async with aiosqlite.connect(self._path) as db:
+        async with self._write() as db:
             await db.executescript(CREATE_SQL)
-            await db.commit()
+            cur = await db.execute("PRAGMA table_info(subscriptions)")
+            existing = {r[1] for r in await cur.fetchall()}
+            for name, definition in MIGRATIONS:
+                if name not in existing:
+                    await db.execute(f"ALTER TABLE subscriptions ADD COLUMN {name} {definition}")
+            await db.executescript(INDEX_SQL)
+
+    def _invalidate_users(self, user_ids: Iterable[int]) -> None:
+        user_ids = set(user_ids)
+        if len(user_ids) > len(self.subs_cache):
+            self.subs_cache.clear()
+            return
+        for user_id in user_ids:
+            self.subs_cache.invalidate(user_id)
 
     async def add_subscription(self, user_id: int, base: str, quote: str, operator: str, threshold: float) -> None:
-        async with aiosqlite.connect(self._path) as db:
-            await db.execute(
-                "INSERT INTO subscriptions(user_id, base, quote, operator, threshold) VALUES (?, ?, ?, ?, ?)",
-                (user_id, base.upper(), quote.upper(), operator, threshold),
-            )
-            await db.commit()
+        try:
+            await self._execute_write(INSERT_SUBSCRIPTION_SQL, (user_id, base.upper(), quote.upper(), operator, threshold))
+        finally:
+            self.subs_cache.invalidate(user_id)
 
     async def remove_subscription(self, user_id: int, base: str, quote: str) -> int:
-        async with aiosqlite.connect(self._path) as db:
-            cur = await db.execute(
-                "DELETE FROM subscriptions WHERE user_id = ? AND base = ? AND quote = ?",
-                (user_id, base.upper(), quote.upper()),
-            )
+        try:
+            return await self._execute_write(DELETE_SUBSCRIPTION_SQL, (user_id, base.upper(), quote.upper()))
+        finally:
+            self.subs_cache.invalidate(user_id)
+
+    async def add_subscriptions_many(self, subs: Iterable[Tuple[int, str, str, str, float]]) -> int:
+        """Добавить подписки (user_id, base, quote, operator, threshold) одной транзакцией."""
+        rows = [(user_id, base.upper(), quote.upper(), op, threshold) for user_id, base, quote, op, threshold in subs]
+        if not rows:
+            return 0
+        try:
+            async with self._write() as db:
+                await db.executemany(INSERT_SUBSCRIPTION_SQL, rows)
+        finally:
+            self._invalidate_users(r[0] for r in rows)
+        return len(rows)
+
+    async def remove_subscriptions_many(self, keys: Iterable[Tuple[int, str, str]]) -> int:
+        """Удалить подписки по (user_id, base, quote) одной транзакцией; возвращает число удалённых."""
+        rows = [(user_id, base.upper(), quote.upper()) for user_id, base, quote in keys]
+        if not rows:
+            return 0
+        try:
+            async with self._write() as db:
+                cur = await db.executemany(DELETE_SUBSCRIPTION_SQL, rows)
+                return cur.rowcount or 0
+        finally:
+            self._invalidate_users(r[0] for r in rows)
+
+    async def iter_subscriptions(self, user_id: Optional[int] = None, chunk_size: int = 1000) -> AsyncIterator[Subscription]:
+        """Подписки (все или одного пользователя) по одной, читая курсор порциями по ``chunk_size``.
+
+        Таблица целиком в памяти не собирается; читатель из пула занят до конца обхода.
+        """
+        if user_id is None:
+            sql, params = f"SELECT {SUBSCRIPTION_COLUMNS} FROM subscriptions ORDER BY id", ()
+        else:
+            sql = f"SELECT {SUBSCRIPTION_COLUMNS} FROM subscriptions WHERE user_id = ? ORDER BY base, quote"
+            params = (user_id,)
+        async with self._read() as db:
+            cur = await db.execute(sql, params)
+            while True:
+                rows = await cur.fetchmany(chunk_size)
+                if not rows:
+                    break
+                for r in rows:
+                    yield Subscription._make(r)
+
+    async def iter_subscriptions_snapshot(self, chunk_size: int = 1000) -> AsyncIterator[Tuple[int, List[Subscription]]]:
+        """Согласованный снимок порциями: (версия журнала, порция подписок).
+
+        Все порции читаются в одной транзакции и несут одну версию; даже для
+        пустой таблицы отдаётся одна пустая порция.
+        """
+        async with self._read() as db:
+            await db.execute("BEGIN")
+            cur = await db.execute("SELECT COALESCE(MAX(version), 0) FROM subscription_changes")
+            version = (await cur.fetchone())[0]
+            cur = await db.execute(f"SELECT {SUBSCRIPTION_COLUMNS} FROM subscriptions")
+            empty = True
+            while True:
+                rows = await cur.fetchmany(chunk_size)
+                if not rows:
+                    break
+                empty = False
+                yield version, [Subscription._make(r) for r in rows]
             await db.commit()
-            return cur.rowcount or 0
+        if empty:
+            yield version, []
 
-    async def list_subscriptions(self, user_id: int):
-        async with aiosqlite.connect(self._path) as db:
+    async def list_subscriptions(self, user_id: int) -> List[Subscription]:
+        cached = self.subs_cache.get(user_id)
+        if cached is None:
+            generation = self.subs_cache.generation
+            cached = tuple([sub async for sub in self.iter_subscriptions(user_id=user_id)])
+            self.subs_cache.put(user_id, cached, generation)
+        return list(cached)
+
+    async def all_subscriptions(self) -> List[dict]:
+        return [sub.as_dict() async for sub in self.iter_subscriptions()]
+
+    async def subscription_pairs(self) -> List[Tuple[str, str]]:
+        async with self._read() as db:
+            cur = await db.execute("SELECT DISTINCT base, quote FROM subscriptions")
+            return [(r[0], r[1]) for r in await cur.fetchall()]
+
+    async def alert_candidates(
+        self, base: str, quote: str, value: float, hysteresis: float = 0.0
+    ) -> Tuple[List[dict], List[dict]]:
+        """Подписки пары, которые надо проверить при курсе ``value``, без чтения всей таблицы.
+
+        Возвращает (не сработавшие, чьё условие сейчас выполняется; сработавшие,
+        которые могут взвестись - кандидаты из ``rearm_bounds``).
+        """
+        params: list = []
+        for _ in _MATCH_RANGES:
+            params.extend((base, quote, value))
+        params.extend((base, quote, value - EPSILON, value + EPSILON))
+        rearm_params: list = []
+        for op in ALERT_OPERATORS:
+            lo, hi = rearm_bounds(op, value, hysteresis)
+            rearm_params.extend((base, quote, lo, base, quote, hi))
+        async with self._read() as db:
+            cur = await db.execute(MATCHING_SQL, params)
+            matching = [_subscription_row(r) for r in await cur.fetchall()]
+            cur = await db.execute(REARM_SQL, rearm_params)
+            triggered = [_subscription_row(r) for r in await cur.fetchall()]
+        return matching, triggered
+
+    async def subscription_journal_bounds(self) -> Tuple[Optional[int], int]:
+        """(старейшая, последняя) версия журнала изменений подписок."""
+        async with self._read() as db:
+            cur = await db.execute("SELECT MIN(version), COALESCE(MAX(version), 0) FROM subscription_changes")
+            oldest, latest = await cur.fetchone()
+        return oldest, latest
+
+    async def subscription_changes_since(self, version: int) -> Tuple[int, Optional[int], List[dict], List[int]]:
+        """Изменения после ``version``: (новая версия, старейшая версия журнала, текущие строки, удалённые id)."""
+        async with self._read() as db:
             cur = await db.execute(
-                "SELECT base, quote, operator, threshold FROM subscriptions WHERE user_id = ? ORDER BY base, quote",
-                (user_id,),
+                "SELECT MIN(version), COALESCE(MAX(version), 0) FROM subscription_changes",
             )
-            rows = await cur.fetchall()
-            return [
-                {
-                    "base": r[0],
-                    "quote": r[1],
-                    "operator": r[2],
-                    "threshold": r[3],
-                }
-                for r in rows
-            ]
-
-    async def all_subscriptions(self):
-        async with aiosqlite.connect(self._path) as db:
+            oldest, latest = await cur.fetchone()
+            if latest <= version:
+                return version, oldest, [], []
             cur = await db.execute(
-                "SELECT id, user_id, base, quote, operator, threshold FROM subscriptions",
+                "SELECT DISTINCT c.subscription_id, s.id, s.user_id, s.base, s.quote, s.operator, s.threshold, "
+                "s.triggered, s.last_fired_at "
+                "FROM subscription_changes c LEFT JOIN subscriptions s ON s.id = c.subscription_id "
+                "WHERE c.version > ? AND c.version <= ?",
+                (version, latest),
             )
             rows = await cur.fetchall()
-            return [
-                {
-                    "id": r[0],
-                    "user_id": r[1],
-                    "base": r[2],
-                    "quote": r[3],
-                    "operator": r[4],
-                    "threshold": r[5],
-                }
-                for r in rows
-            ]
+        changed = [_subscription_row(r[1:]) for r in rows if r[1] is not None]
+        removed = [r[0] for r in rows if r[1] is None]
+        return latest, oldest, changed, removed
+
+    async def save_alert_states(self, subs: List[dict]) -> None:
+        if not subs:
+            return
+        async with self._write() as db:
+            await db.executemany(
+                "UPDATE subscriptions SET triggered = ?, last_fired_at = ? WHERE id = ?",
+                [(sub["triggered"], sub["last_fired_at"], sub["id"]) for sub in subs],
+            )
 
+    async def prune_subscription_changes(self, up_to_version: int) -> None:
+        async with self._write() as db:
+            await db.execute("DELETE FROM subscription_changes WHERE version <= ?", (up_to_version,))
 
+    async def save_rate_snapshot(
+        self, usd_values: Dict[str, float], updated_at: float, currency_times: Optional[Dict[str, float]] = None
+    ) -> None:
+        """Заменить снимок целиком одной транзакцией.
+
+        В строке валюты - время получения именно её курса (``currency_times``),
+        поэтому перенесённые из прошлого обновления значения не молодеют.
+        """
+        currency_times = currency_times or {}
+        async with self._write() as db:
+            await db.execute("DELETE FROM rate_snapshots")
+            await db.executemany(
+                "INSERT INTO rate_snapshots(currency, usd, updated_at) VALUES (?, ?, ?)",
+                [(cur, value, currency_times.get(cur, updated_at)) for cur, value in usd_values.items()],
+            )
+
+    async def load_rate_snapshot(self) -> Tuple[Dict[str, float], Optional[float], Dict[str, float]]:
+        """(курсы к USD, время снимка, время получения каждого курса)."""
+        async with self._read() as db:
+            cur = await db.execute("SELECT currency, usd, updated_at FROM rate_snapshots")
+            rows = await cur.fetchall()
+        if not rows:
+            return {}, None, {}
+        # Снимок пишется целиком, и свежие курсы в нём получены в момент снимка - это самое позднее время
+        return {r[0]: r[1] for r in rows}, max(r[2] for r in rows), {r[0]: r[2] for r in rows}
+
+    async def save_rate_history(self, usd_values: Dict[str, float], ts: float, resolutions: Iterable[int]) -> None:
+        """Сырая точка на валюту и обновление свечей всех ``resolutions`` одной транзакцией."""
+        at = int(ts)
+        raw = [(cur, at, value) for cur, value in usd_values.items()]
+        candles = [
+            (cur, res, at - at % res, value, value, value, value)
+            for res in resolutions
+            for cur, value in usd_values.items()
+        ]
+        async with self._write() as db:
+            await db.executemany(
+                "INSERT OR REPLACE INTO rate_history(currency, resolution, bucket, close) VALUES (?, 0, ?, ?)",
+                raw,
+            )
+            await db.executemany(
+                "INSERT INTO rate_history(currency, resolution, bucket, open, high, low, close) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?) "
+                "ON CONFLICT(currency, resolution, bucket) DO UPDATE SET "
+                "high = max(high, excluded.high), low = min(low, excluded.low), close = excluded.close",
+                candles,
+            )
+
+    async def prune_rate_history(self, currencies: Iterable[str], cutoffs: Dict[int, float]) -> int:
+        """Удалить точки старше ``cutoffs[resolution]``; возвращает число удалённых строк."""
+        params = [(cur, res, int(cutoff)) for res, cutoff in cutoffs.items() for cur in currencies]
+        if not params:
+            return 0
+        async with self._write() as db:
+            # По валюте и разрешению - чтобы удаление шло по диапазону первичного ключа
+            cur = await db.executemany(
+                "DELETE FROM rate_history WHERE currency = ? AND resolution = ? AND bucket < ?",
+                params,
+            )
+            return cur.rowcount or 0
+
+    async def rate_history_currencies(self) -> List[str]:
+        async with self._read() as db:
+            cur = await db.execute("SELECT DISTINCT currency FROM rate_history")
+            return [r[0] for r in await cur.fetchall()]
+
+    async def rate_history_point(self, currency: str, resolution: int, ts: float, since: float) -> Optional[float]:
+        """Последнее значение валюты к USD в разрешении ``resolution`` в интервале (since, ts]."""
+        async with self._read() as db:
+            cur = await db.execute(
+                "SELECT close FROM rate_history WHERE currency = ? AND resolution = ? AND bucket <= ? AND bucket > ? "
+                "ORDER BY bucket DESC LIMIT 1",
+                (currency, resolution, int(ts), int(since)),
+            )
+            row = await cur.fetchone()
+        return row[0] if row else None
+
+    async def rate_history_series(
+        self, currency: str, resolution: int, since: float, until: float
+    ) -> List[Tuple[int, float]]:
+        """(bucket, close) валюты к USD за [since, until] по возрастанию времени."""
+        async with self._read() as db:
+            cur = await db.execute(
+                "SELECT bucket, close FROM rate_history WHERE currency = ? AND resolution = ? "
+                "AND bucket >= ? AND bucket <= ? ORDER BY bucket",
+                (currency, resolution, int(since), int(until)),
+            )
+            return [(r[0], r[1]) for r in await cur.fetchall()]
@@ -0,0 +1,283 @@
+from __future__ import annotations
+
+import asyncio
+import heapq
+import logging
+import time
+from collections import deque
+from dataclasses import dataclass
+from typing import Deque, Dict, List, Optional, Tuple
+
+from aiogram import Bot
+from aiogram.exceptions import (
+    TelegramBadRequest,
+    TelegramEntityTooLarge,
+    TelegramForbiddenError,
+    TelegramNotFound,
+    TelegramRetryAfter,
+)
+
+
+logger = logging.getLogger("quickconverter.delivery")
+
+
+class TokenBucket:
+    """Ограничитель частоты: ``rate`` токенов в секунду, запас до ``capacity``."""
+
+    def __init__(self, rate: float, capacity: Optional[float] = None) -> None:
+        self.rate = rate
+        self.capacity = capacity if capacity is not None else max(1.0, rate)
+        self._tokens = self.capacity
+        self._updated = time.monotonic()
+        self._lock = asyncio.Lock()
+
+    def _refill(self) -> None:
+        now = time.monotonic()
+        self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+    async def acquire(self) -> None:
+        async with self._lock:
+            self._refill()
+            if self._tokens < 1:
+                await asyncio.sleep((1 - self._tokens) / self.rate)
+                self._refill()
+            self._tokens -= 1
+
+
+@dataclass
+class DeliveryStats:
+    queued: int = 0
+    sent: int = 0
+    failed: int = 0
+    retried: int = 0
+
+
+@dataclass
+class _Message:
+    chat_id: int
+    text: str
+    attempt: int = 0
+
+
+class DeliveryQueue:
+    """Очередь исходящих сообщений с пулом воркеров и лимитами Telegram.
+
+    Сообщения копятся в очереди своего чата (порядок внутри чата
+    сохраняется), а воркеры берут следующий чат, которому уже можно
+    писать: лимит на чат (~1/с) - это время, раньше которого чат не
+    выдаётся, поэтому воркер никогда не спит над сообщением одного чата,
+    пока ждут другие. Общий лимит (~30/с на бота) держит токен-бакет;
+    ``TelegramRetryAfter`` ставит на паузу всю отправку. ``put`` ждёт,
+    пока в очереди не освободится место - это обратное давление на
+    планировщик.
+    """
+
+    def __init__(
+        self,
+        bot: Bot,
+        workers: int = 8,
+        global_rate: float = 30,
+        per_chat_rate: float = 1,
+        max_queue: int = 10000,
+        max_retries: int = 3,
+    ) -> None:
+        self._bot = bot
+        self._workers_count = max(1, workers)
+        self._global = TokenBucket(global_rate)
+        self._chat_interval = 1 / per_chat_rate if per_chat_rate > 0 else 0.0
+        self._max_retries = max_retries
+        self._paused_until = 0.0
+        # Очереди чатов; чат с непустой очередью лежит либо в _ready, либо у воркера
+        self._pending: Dict[int, Deque[_Message]] = {}
+        self._ready: List[Tuple[float, int, int]] = []
+        self._seq = 0
+        # Раньше этого момента чату писать нельзя (лимит на чат)
+        self._chat_next: Dict[int, float] = {}
+        self._changed = asyncio.Event()
+        self._slots = asyncio.Semaphore(max(1, max_queue))
+        self._unfinished = 0
+        self._drained = asyncio.Event()
+        self._drained.set()
+        self._workers: List[asyncio.Task] = []
+        self.stats = DeliveryStats()
+
+    def __len__(self) -> int:
+        return self._unfinished
+
+    def start(self) -> None:
+        if not self._workers:
+            self._workers = [asyncio.create_task(self._worker()) for _ in range(self._workers_count)]
+
+    async def close(self, drain_timeout: float = 5) -> None:
+        try:
+            await asyncio.wait_for(self._drained.wait(), drain_timeout)
+        except asyncio.TimeoutError:
+            pass
+        for task in self._workers:
+            task.cancel()
+        await asyncio.gather(*self._workers, return_exceptions=True)
+        self._workers = []
+
+    async def put(self, chat_id: int, text: str) -> None:
+        await self._slots.acquire()
+        self._unfinished += 1
+        self._drained.clear()
+        self.stats.queued += 1
+        queue = self._pending.get(chat_id)
+        if queue is not None:
+            # Чат уже запланирован или у воркера - просто встаём в его очередь
+            queue.append(_Message(chat_id, text))
+            return
+        self._pending[chat_id] = deque([_Message(chat_id, text)])
+        self._schedule(chat_id, self._chat_next.get(chat_id, 0.0))
+
+    def _schedule(self, chat_id: int, not_before: float) -> None:
+        self._seq += 1
+        heapq.heappush(self._ready, (not_before, self._seq, chat_id))
+        self._changed.set()
+
+    def _done(self) -> None:
+        self._slots.release()
+        self._unfinished -= 1
+        if self._unfinished == 0:
+            self._drained.set()
+
+    async def _next_chat(self) -> int:
+        while True:
+            timeout: Optional[float] = None
+            if self._ready:
+                not_before = max(self._ready[0][0], self._paused_until)
+                timeout = not_before - time.monotonic()
+                if timeout <= 0:
+                    return heapq.heappop(self._ready)[2]
+            self._changed.clear()
+            try:
+                await asyncio.wait_for(self._changed.wait(), timeout)
+            except asyncio.TimeoutError:
+                pass
+
+    def _release_chat(self, chat_id: int, not_before: float) -> None:
+        self._chat_next[chat_id] = not_before
+        if len(self._chat_next) > 10000:
+            # Забываем чаты, чей лимит уже истёк
+            now = time.monotonic()
+            self._chat_next = {k: v for k, v in self._chat_next.items() if v > now or k in self._pending}
+        if self._pending[chat_id]:
+            self._schedule(chat_id, not_before)
+        else:
+            del self._pending[chat_id]
+
+    async def _worker(self) -> None:
+        while True:
+            chat_id = await self._next_chat()
+            msg = self._pending[chat_id].popleft()
+            not_before = time.monotonic() + self._chat_interval
+            try:
+                delay = await self._deliver(msg)
+                if delay is not None:
+                    # Повтор: сообщение остаётся первым в очереди чата
+                    self._pending[chat_id].appendleft(msg)
+                    not_before = max(not_before, time.monotonic() + delay)
+                else:
+                    self._done()
+            except BaseException:
+                self._done()
+                raise
+            finally:
+                self._release_chat(chat_id, not_before)
+
+    async def _wait_pause(self) -> None:
+        # Пауза могла начаться, пока воркер ждал токен, или продлиться во время сна
+        while True:
+            pause = self._paused_until - time.monotonic()
+            if pause <= 0:
+                return
+            await asyncio.sleep(pause)
+
+    async def _deliver(self, msg: _Message) -> Optional[float]:
+        """Отправить сообщение; возвращает задержку перед повтором или None, если с ним покончено."""
+        await self._global.acquire()
+        await self._wait_pause()
+        try:
+            await self._bot.send_message(msg.chat_id, msg.text)
+            self.stats.sent += 1
+            return None
+        except TelegramRetryAfter as e:
+            # Flood control: вся отправка ждёт retry_after; попыткой это не считается
+            self._paused_until = max(self._paused_until, time.monotonic() + e.retry_after)
+            self.stats.retried += 1
+            return 0.0
+        except (TelegramForbiddenError, TelegramBadRequest, TelegramNotFound, TelegramEntityTooLarge) as e:
+            # Бот заблокирован, чат не найден, битое сообщение - повтор не поможет
+            logger.warning("delivery to %s failed: %s", msg.chat_id, e)
+            delay = None
+        except Exception as e:
+            # Сеть, таймауты, 5xx (в aiogram 3 это тоже TelegramAPIError) и прочее - повторяем с отступом
+            logger.warning("delivery to %s failed: %s", msg.chat_id, e)
+            delay = min(30, 2 ** msg.attempt)
+        if delay is not None and msg.attempt < self._max_retries:
+            msg.attempt += 1
+            self.stats.retried += 1
+            return delay
+        self.stats.failed += 1
+        return None
+
+
+class DigestBuffer:
+    """Склеивает сработавшие условия одного пользователя в одно сообщение.
+
+    Строки копятся ``window`` секунд с момента первой строки пользователя
+    (при ``window=0`` - до ближайшего ``flush``), затем уходят в очередь
+    одним сообщением, разбитым по лимиту длины Telegram.
+    """
+
+    MAX_LENGTH = 4000
+
+    def __init__(self, delivery: DeliveryQueue, window: float = 0) -> None:
+        self._delivery = delivery
+        self._window = window
+        self._lines: Dict[int, List[str]] = {}
+        self._started: Dict[int, float] = {}
+
+    def __len__(self) -> int:
+        return len(self._lines)
+
+    def add(self, user_id: int, line: str) -> None:
+        if user_id not in self._lines:
+            self._lines[user_id] = []
+            self._started[user_id] = time.monotonic()
+        self._lines[user_id].append(line)
+
+    def next_deadline(self) -> Optional[float]:
+        if not self._started:
+            return None
+        return min(self._started.values()) + self._window
+
+    async def flush(self, force: bool = False) -> int:
+        """Отправить накопленное, чьё окно истекло; возвращает число сообщений."""
+        now = time.monotonic()
+        ready = [u for u, t in self._started.items() if force or now - t >= self._window]
+        sent = 0
+        for user_id in ready:
+            lines = self._lines.pop(user_id)
+            del self._started[user_id]
+            for text in self._render(lines):
+                await self._delivery.put(user_id, text)
+                sent += 1
+        return sent
+
+    def _render(self, lines: List[str]) -> List[str]:
+        if len(lines) == 1:
+            return [f"Сработало условие: {lines[0]}"]
+        header = f"🔔 Сработало условий: {len(lines)}"
+        chunks: List[str] = []
+        current = header
+        for line in lines:
+            item = f"\n• {line}"
+            if len(current) + len(item) > self.MAX_LENGTH:
+                chunks.append(current)
+                current = header + " (продолжение)"
+            current += item
+        chunks.append(current)
+        return chunks
@@ -0,0 +1,120 @@
+from __future__ import annotations
+
+import asyncio
+import json
+import random
+from collections import Counter
+from typing import Dict, Optional
+
+import httpx
+
+from .rates import COINGECKO_IDS, FIAT_BASES
+
+
+# Примерные цены в USD за 1 единицу валюты
+DEFAULT_USD_VALUES: Dict[str, float] = {
+    "USD": 1.0,
+    "EUR": 1.08,
+    "GBP": 1.27,
+    "JPY": 0.0067,
+    "CHF": 1.12,
+    "CNY": 0.138,
+    "AUD": 0.66,
+    "CAD": 0.73,
+    "RUB": 0.011,
+    "UAH": 0.024,
+    "KZT": 0.0021,
+    "BTC": 65000.0,
+    "ETH": 3200.0,
+    "USDT": 1.0,
+    "BNB": 580.0,
+    "XRP": 0.52,
+    "SOL": 150.0,
+    "TON": 6.5,
+    "DOGE": 0.12,
+    "TRX": 0.12,
+}
+
+
+class FakeProviderServer(httpx.AsyncBaseTransport):
+    """Локальная подмена всех провайдеров курсов для нагрузочных тестов.
+
+    Отвечает на URL exchangerate-api, exchangerate.host, currency-converter5
+    и CoinGecko в их собственном формате. Задержка, доля ошибок (общая и по
+    хосту) и цены настраиваются; ``requests`` считает вызовы по хостам.
+
+        server = FakeProviderServer(latency=0.05, error_rate=0.1)
+        rates = RatesService("bench", transport=server)
+    """
+
+    def __init__(
+        self,
+        usd_values: Optional[Dict[str, float]] = None,
+        latency: float = 0.0,
+        jitter: float = 0.0,
+        error_rate: float = 0.0,
+        host_error_rates: Optional[Dict[str, float]] = None,
+        seed: Optional[int] = None,
+    ) -> None:
+        self.usd_values = dict(DEFAULT_USD_VALUES if usd_values is None else usd_values)
+        self.latency = latency
+        self.jitter = jitter
+        self.error_rate = error_rate
+        self.host_error_rates = dict(host_error_rates or {})
+        self.requests: Counter = Counter()
+        self._random = random.Random(seed)
+        self._coin_ids = {coin_id: symbol for symbol, coin_id in COINGECKO_IDS.items()}
+
+    @property
+    def total_requests(self) -> int:
+        return sum(self.requests.values())
+
+    def reset(self) -> None:
+        self.requests.clear()
+
+    async def handle_async_request(self, request: httpx.Request) -> httpx.Response:
+        host = request.url.host
+        self.requests[host] += 1
+        delay = self.latency + self._random.uniform(0, self.jitter)
+        if delay > 0:
+            await asyncio.sleep(delay)
+        if self._random.random() < self.host_error_rates.get(host, self.error_rate):
+            return httpx.Response(503, request=request)
+        body = self._route(request.url)
+        if body is None:
+            return httpx.Response(404, request=request)
+        return httpx.Response(200, content=json.dumps(body).encode(), request=request)
+
+    def _route(self, url: httpx.URL) -> Optional[dict]:
+        params = url.params
+        if url.host == "api.exchangerate-api.com":
+            return self._table(url.path.rsplit("/", 1)[-1].upper())
+        if url.host == "api.exchangerate.host":
+            return self._table(params.get("base", "USD").upper())
+        if url.host == "currency-converter5.p.rapidapi.com":
+            rate = self._rate(params.get("from", "").upper(), params.get("to", "").upper())
+            return {"result": {"converted_amount": rate}} if rate is not None else None
+        if url.host == "api.coingecko.com":
+            vs = [v for v in params.get("vs_currencies", "").split(",") if v]
+            result = {}
+            for coin_id in params.get("ids", "").split(","):
+                symbol = self._coin_ids.get(coin_id)
+                if symbol is None:
+                    continue
+                block = {v: self._rate(symbol, v.upper()) for v in vs}
+                result[coin_id] = {k: v for k, v in block.items() if v is not None}
+            return result
+        return None
+
+    def _table(self, base: str) -> Optional[dict]:
+        if base not in self.usd_values:
+            return None
+        rates = {q: self._rate(base, q) for q in FIAT_BASES if q in self.usd_values}
+        return {"base": base, "rates": rates}
+
+    def _rate(self, base: str, quote: str) -> Optional[float]:
+        b = self.usd_values.get(base)
+        q = self.usd_values.get(quote)
+        if not b or not q:
+            return None
+        return b / q
@@ -0,0 +1,131 @@
+from __future__ import annotations
+
+import time
+from dataclasses import dataclass
+from typing import Dict, List, Optional, Tuple
+
+from .db import Database
+from .matrix import RateMatrix
+
+
+RAW = 0
+MINUTE = 60
+HOUR = 3600
+DAY = 86400
+RESOLUTIONS = {"raw": RAW, "1m": MINUTE, "1h": HOUR, "1d": DAY}
+
+
+@dataclass
+class RateChange:
+    base: str
+    quote: str
+    old: float
+    new: float
+    since: float
+
+    @property
+    def delta(self) -> float:
+        return self.new - self.old
+
+    @property
+    def percent(self) -> float:
+        return (self.new / self.old - 1) * 100 if self.old else 0.0
+
+
+class RateHistory:
+    """Локальная история курсов: сырые точки каждого обновления и свечи 1m/1h/1d.
+
+    Хранится только курс каждой валюты к USD (как в ``RateMatrix``), любая
+    пара считается делением - N строк на точку вместо N². У каждого
+    разрешения свой срок хранения (``retention``, секунды; 0 - бессрочно),
+    запросы берут самое подробное разрешение, которое ещё покрывает момент.
+    """
+
+    def __init__(
+        self,
+        db: Database,
+        retention: Optional[Dict[int, float]] = None,
+        prune_interval: float = 3600,
+    ) -> None:
+        self._db = db
+        self.retention = retention or {RAW: 2 * DAY, MINUTE: 7 * DAY, HOUR: 730 * DAY, DAY: 0}
+        self._prune_interval = prune_interval
+        self._pruned_at = 0.0
+
+    @classmethod
+    def from_settings(cls, db: Database, settings) -> "RateHistory":
+        return cls(
+            db,
+            retention={
+                RAW: settings.rate_history_raw_hours * HOUR,
+                MINUTE: settings.rate_history_minute_days * DAY,
+                HOUR: settings.rate_history_hour_days * DAY,
+                DAY: settings.rate_history_day_days * DAY,
+            },
+        )
+
+    async def record(self, matrix: RateMatrix) -> None:
+        # Только то, что получено этим обновлением: курсы, перенесённые из прошлой
+        # матрицы (провайдер недоступен), записали бы ложную ровную историю
+        values = {
+            cur: value for cur, value in matrix.values().items()
+            if matrix.currency_updated_at(cur) == matrix.updated_at
+        }
+        if not values:
+            return
+        await self._db.save_rate_history(values, matrix.updated_at, [r for r in self.retention if r != RAW])
+        if matrix.updated_at - self._pruned_at >= self._prune_interval:
+            await self.prune(matrix.updated_at)
+
+    async def prune(self, now: Optional[float] = None) -> int:
+        now = time.time() if now is None else now
+        self._pruned_at = now
+        cutoffs = {res: now - keep for res, keep in self.retention.items() if keep > 0}
+        return await self._db.prune_rate_history(await self._db.rate_history_currencies(), cutoffs)
+
+    def _resolutions_for(self, ts: float, now: float) -> List[int]:
+        # От подробного к грубому, пропуская разрешения, чей срок хранения уже истёк для ts
+        return [
+            res for res in sorted(self.retention)
+            if self.retention[res] <= 0 or now - ts <= self.retention[res]
+        ]
+
+    async def usd_at(self, currency: str, ts: float, now: Optional[float] = None) -> Optional[float]:
+        if currency == "USD":
+            return 1.0
+        now = time.time() if now is None else now
+        for res in self._resolutions_for(ts, now):
+            # Точка должна быть не старше пары интервалов разрешения (для сырых - 10 минут)
+            window = 2 * res if res else 600
+            value = await self._db.rate_history_point(currency, res, ts, ts - window)
+            if value is not None:
+                return value
+        return None
+
+    async def rate_at(self, base: str, quote: str, ts: float, now: Optional[float] = None) -> Optional[float]:
+        b = await self.usd_at(base, ts, now)
+        q = await self.usd_at(quote, ts, now)
+        if b is None or q is None:
+            return None
+        return b / q
+
+    async def change(self, base: str, quote: str, period: float = DAY, now: Optional[float] = None) -> Optional[RateChange]:
+        """Изменение курса пары за ``period`` секунд до ``now`` (по умолчанию - за 24 часа)."""
+        now = time.time() if now is None else now
+        new = await self.rate_at(base, quote, now, now)
+        old = await self.rate_at(base, quote, now - period, now)
+        if new is None or old is None:
+            return None
+        return RateChange(base=base, quote=quote, old=old, new=new, since=now - period)
+
+    async def series(
+        self, base: str, quote: str, resolution: str = "1h", since: Optional[float] = None, until: Optional[float] = None
+    ) -> List[Tuple[int, float]]:
+        """Курс пары (bucket, close) за период в разрешении raw/1m/1h/1d."""
+        res = RESOLUTIONS[resolution]
+        until = time.time() if until is None else until
+        since = until - DAY if since is None else since
+        # USD тоже пишется в историю (со значением 1), так что обе стороны есть в таблице
+        b = dict(await self._db.rate_history_series(base, res, since, until))
+        q = dict(await self._db.rate_history_series(quote, res, since, until))
+        return [(bucket, b[bucket] / q[bucket]) for bucket in sorted(b) if q.get(bucket)]
@@ -0,0 +1,77 @@
+from __future__ import annotations
+
+import math
+import time
+from array import array
+from typing import Dict, Iterable, Optional, Sequence
+
+
+class RateMatrix:
+    """Курсы всех поддерживаемых валют к USD в плотном массиве.
+
+    Любая пара считается делением двух ячеек: ``usd[base] / usd[quote]``.
+    Отсутствующие значения хранятся как NaN. Для каждой валюты хранится
+    и время, когда её курс был получен: при частичном обновлении старые
+    значения переносятся из прошлой матрицы со своим временем.
+    """
+
+    def __init__(self, currencies: Sequence[str], updated_at: Optional[float] = None) -> None:
+        self.currencies = tuple(currencies)
+        self._index: Dict[str, int] = {c: i for i, c in enumerate(self.currencies)}
+        self._usd = array("d", [math.nan] * len(self.currencies))
+        self._updated = array("d", [math.nan] * len(self.currencies))
+        # updated_at - настенное время (для БД и пользователя), fetched_at - монотонное
+        self.updated_at = time.time() if updated_at is None else updated_at
+        self.fetched_at = time.monotonic() - max(0.0, time.time() - self.updated_at)
+
+    def age(self) -> float:
+        return time.monotonic() - self.fetched_at
+
+    def __contains__(self, currency: str) -> bool:
+        i = self._index.get(currency)
+        return i is not None and not math.isnan(self._usd[i])
+
+    def set_usd(self, currency: str, value: float, updated_at: Optional[float] = None) -> bool:
+        i = self._index.get(currency)
+        if i is None or not value > 0:
+            return False
+        self._usd[i] = value
+        self._updated[i] = self.updated_at if updated_at is None else updated_at
+        return True
+
+    def merge(self, other: "RateMatrix") -> None:
+        """Перенести значения из ``other`` (вместе с их временем получения)."""
+        for currency, value in other.values().items():
+            self.set_usd(currency, value, other.currency_updated_at(currency))
+
+    def currency_updated_at(self, currency: str) -> Optional[float]:
+        i = self._index.get(currency)
+        if i is None or math.isnan(self._usd[i]):
+            return None
+        return self._updated[i]
+
+    def updated_times(self) -> Dict[str, float]:
+        return {c: t for c, v, t in zip(self.currencies, self._usd, self._updated) if not math.isnan(v)}
+
+    def oldest_update(self, currencies: Optional[Iterable[str]] = None) -> Optional[float]:
+        """Самое раннее время получения среди ``currencies`` (по умолчанию - всех загруженных)."""
+        times = [self.currency_updated_at(c) for c in (self.currencies if currencies is None else currencies)]
+        times = [t for t in times if t is not None]
+        return min(times) if times else None
+
+    def usd(self, currency: str) -> Optional[float]:
+        i = self._index.get(currency)
+        if i is None:
+            return None
+        v = self._usd[i]
+        return None if math.isnan(v) else v
+
+    def rate(self, base: str, quote: str) -> Optional[float]:
+        b = self.usd(base)
+        q = self.usd(quote)
+        if b is None or q is None:
+            return None
+        return b / q
+
+    def values(self) -> Dict[str, float]:
+        return {c: v for c, v in zip(self.currencies, self._usd) if not math.isnan(v)}
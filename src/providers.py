@@ -0,0 +1,101 @@
+from __future__ import annotations
+
+from abc import ABC, abstractmethod
+from typing import Any, Awaitable, Callable, Dict, Iterable, Optional
+
+
+GetJson = Callable[[str], Awaitable[Any]]
+# Нормализованная таблица курсов: {base: {quote: сколько quote за 1 base}}
+RateTable = Dict[str, Dict[str, float]]
+
+
+def _numbers(block: Dict[str, Any], upper: bool = False) -> Dict[str, float]:
+    return {
+        (k.upper() if upper else k): float(v)
+        for k, v in block.items()
+        if isinstance(v, (int, float)) and not isinstance(v, bool)
+    }
+
+
+class RateProvider(ABC):
+    """Источник курсов: строит URL и разбирает ответ в RateTable.
+
+    Сетевой вызов делает RatesService (через ``get_json``), поэтому
+    провайдеры не знают про HTTP-клиент, кэш и circuit breaker.
+    Провайдер без ``url``/``parse`` не создастся - ошибка видна сразу,
+    а не на первом запросе курса.
+    """
+
+    name = ""
+
+    @abstractmethod
+    def url(self, base: str, quote: Optional[str] = None) -> str:
+        ...
+
+    @abstractmethod
+    def parse(self, data: Any, base: str, quote: Optional[str] = None) -> RateTable:
+        ...
+
+    async def fetch(self, get_json: GetJson, base: str, quote: Optional[str] = None) -> RateTable:
+        table = self.parse(await get_json(self.url(base, quote)), base, quote)
+        if not any(table.values()):
+            raise ValueError(f"{self.name}: empty response")
+        return table
+
+
+class ExchangeRateApiProvider(RateProvider):
+    name = "exchangerate-api"
+
+    def url(self, base: str, quote: Optional[str] = None) -> str:
+        return f"https://api.exchangerate-api.com/v4/latest/{base}"
+
+    def parse(self, data: Any, base: str, quote: Optional[str] = None) -> RateTable:
+        return {base: _numbers(data.get("rates") or {})}
+
+
+class ExchangeRateHostProvider(ExchangeRateApiProvider):
+    name = "exchangerate.host"
+
+    def url(self, base: str, quote: Optional[str] = None) -> str:
+        return f"https://api.exchangerate.host/latest?base={base}"
+
+
+class CurrencyConverter5Provider(RateProvider):
+    # Отдаёт только одну пару за запрос
+    name = "currency-converter5"
+
+    def url(self, base: str, quote: Optional[str] = None) -> str:
+        return (
+            "https://currency-converter5.p.rapidapi.com/currency/convert"
+            f"?format=json&from={base}&to={quote}&amount=1"
+        )
+
+    def parse(self, data: Any, base: str, quote: Optional[str] = None) -> RateTable:
+        result = data.get("result")
+        if not result or "converted_amount" not in result or quote is None:
+            return {}
+        return {base: {quote: float(result["converted_amount"])}}
+
+
+class CoinGeckoProvider(RateProvider):
+    # Все монеты против всего фиата одним запросом; base игнорируется
+    name = "coingecko"
+
+    def __init__(self, symbol_to_id: Dict[str, str], vs_currencies: Iterable[str]) -> None:
+        self._symbol_to_id = dict(symbol_to_id)
+        self._url = (
+            "https://api.coingecko.com/api/v3/simple/price"
+            f"?ids={','.join(self._symbol_to_id.values())}"
+            f"&vs_currencies={','.join(sorted(c.lower() for c in vs_currencies))}"
+        )
+
+    def url(self, base: str, quote: Optional[str] = None) -> str:
+        return self._url
+
+    def parse(self, data: Any, base: str, quote: Optional[str] = None) -> RateTable:
+        tables: RateTable = {}
+        for symbol, coin_id in self._symbol_to_id.items():
+            table = _numbers(data.get(coin_id) or {}, upper=True)
+            if table:
+                tables[symbol] = table
+        return tables
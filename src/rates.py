@@ -1,29 +1,200 @@
 from __future__ import annotations
 
 import asyncio
-from typing import Dict, Optional, Tuple
+import logging
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from dataclasses import dataclass
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Set, Tuple
 
 import httpx
 
+from .cache import SingleFlight, SnapshotCache
+from .changes import RateChangeFeed
+from .config import Settings
+from .matrix import RateMatrix
+from .providers import (
+    CoinGeckoProvider,
+    CurrencyConverter5Provider,
+    ExchangeRateApiProvider,
+    ExchangeRateHostProvider,
+    RateProvider,
+    RateTable,
+)
+from .router import ProviderHealth, ProviderRouter
+
+
+logger = logging.getLogger("quickconverter.rates")
+
 
 FIAT_BASES = {"USD", "EUR", "GBP", "JPY", "CHF", "CNY", "AUD", "CAD", "RUB", "UAH", "KZT"}
 CRYPTO_BASES = {"BTC", "ETH", "USDT", "BNB", "XRP", "SOL", "TON", "DOGE", "TRX"}
+SUPPORTED_CURRENCIES = sorted(FIAT_BASES | CRYPTO_BASES)
+
+COINGECKO_IDS: Dict[str, str] = {
+    "BTC": "bitcoin",
+    "ETH": "ethereum",
+    "BNB": "binancecoin",
+    "XRP": "ripple",
+    "SOL": "solana",
+    "TON": "the-open-network",
+    "DOGE": "dogecoin",
+    "TRX": "tron",
+    "USDT": "tether",
+}
+
+
+def default_providers() -> Tuple[List[RateProvider], List[RateProvider], List[RateProvider]]:
+    """Провайдеры по умолчанию: (таблицы фиата, отдельные пары, крипта)."""
+    return (
+        [ExchangeRateApiProvider(), ExchangeRateHostProvider()],
+        [CurrencyConverter5Provider()],
+        [CoinGeckoProvider(COINGECKO_IDS, FIAT_BASES)],
+    )
+
+
+# Провайдер жив, просто не знает валюту. Остальные 4xx (401/403 - нет ключа, 429 - квота) - отказ провайдера
+_UNKNOWN_CURRENCY_STATUSES = {400, 404}
+
+
+def _is_provider_failure(exc: Exception) -> bool:
+    if isinstance(exc, httpx.HTTPStatusError):
+        return exc.response.status_code not in _UNKNOWN_CURRENCY_STATUSES
+    return True
+
+
+@dataclass
+class RatesCounters:
+    lookups: int = 0
+    cache_hits: int = 0
+    upstream_requests: int = 0
+
+
+# Счётчики текущей области (см. RatesService.scoped_counters); наследуются задачами, созданными внутри неё
+_scoped_counters: ContextVar[Optional[RatesCounters]] = ContextVar("rates_scoped_counters", default=None)
 
 
 class RatesService:
-    def __init__(self, user_agent: str) -> None:
-        self._client = httpx.AsyncClient(timeout=10, headers={"User-Agent": user_agent})
+    def __init__(
+        self,
+        user_agent: str,
+        cache_ttl: float = 60,
+        cache_stale_ttl: float = 300,
+        cache_size: int = 64,
+        provider_failure_threshold: int = 3,
+        provider_reset_seconds: float = 60,
+        http_max_connections: int = 20,
+        http_max_keepalive: int = 10,
+        http_connect_timeout: float = 3.0,
+        http_read_timeout: float = 10.0,
+        http2: bool = False,
+        http_conditional_requests: bool = True,
+        fiat_providers: Optional[List[RateProvider]] = None,
+        pair_providers: Optional[List[RateProvider]] = None,
+        coin_providers: Optional[List[RateProvider]] = None,
+        transport: Optional[httpx.AsyncBaseTransport] = None,
+    ) -> None:
+        if http2:
+            try:
+                import h2  # noqa: F401
+            except ImportError:
+                logger.warning("HTTP/2 disabled: install httpx[http2]")
+                http2 = False
+        self._client = httpx.AsyncClient(
+            timeout=httpx.Timeout(http_read_timeout, connect=http_connect_timeout),
+            limits=httpx.Limits(
+                max_connections=http_max_connections,
+                max_keepalive_connections=http_max_keepalive,
+            ),
+            http2=http2,
+            headers={"User-Agent": user_agent},
+            transport=transport,
+        )
+        default_fiat, default_pair, default_coin = default_providers()
+        self._fiat_providers = {p.name: p for p in (fiat_providers if fiat_providers is not None else default_fiat)}
+        self._pair_providers = {p.name: p for p in (pair_providers if pair_providers is not None else default_pair)}
+        self._coin_providers = {p.name: p for p in (coin_providers if coin_providers is not None else default_coin)}
+        self._conditional = http_conditional_requests
+        # url -> (ETag, Last-Modified, тело последнего ответа 200)
+        self._validators: Dict[str, Tuple[Optional[str], Optional[str], Any]] = {}
+        self._snapshots = SnapshotCache(ttl=cache_ttl, stale_ttl=cache_stale_ttl, max_size=cache_size)
+        self._cache_ttl = cache_ttl
+        self._cache_stale_ttl = cache_stale_ttl
+        self._matrix: Optional[RateMatrix] = None
+        self._background_refresh = False
+        self._change_feeds: List[RateChangeFeed] = []
+        self.counters = RatesCounters()
+        self._flight = SingleFlight()
+        self._router = ProviderRouter(
+            failure_threshold=provider_failure_threshold,
+            reset_timeout=provider_reset_seconds,
+        )
+        self._background: Set[asyncio.Task] = set()
+
+    @classmethod
+    def from_settings(cls, settings: Settings) -> "RatesService":
+        return cls(
+            user_agent=settings.user_agent,
+            cache_ttl=settings.rates_cache_ttl_seconds,
+            cache_stale_ttl=settings.rates_cache_stale_seconds,
+            cache_size=settings.rates_cache_size,
+            provider_failure_threshold=settings.provider_failure_threshold,
+            provider_reset_seconds=settings.provider_reset_seconds,
+            http_max_connections=settings.http_max_connections,
+            http_max_keepalive=settings.http_max_keepalive,
+            http_connect_timeout=settings.http_connect_timeout,
+            http_read_timeout=settings.http_read_timeout,
+            http2=settings.http2,
+            http_conditional_requests=settings.http_conditional_requests,
+        )
 
     async def close(self) -> None:
+        for task in list(self._background):
+            task.cancel()
         await self._client.aclose()
 
+    def _spawn(self, coro) -> None:
+        task = asyncio.create_task(coro)
+        self._background.add(task)
+        task.add_done_callback(self._background.discard)
+
+    @contextmanager
+    def scoped_counters(self) -> Iterator[RatesCounters]:
+        """Отдельные счётчики для вызовов внутри блока (например, одного тика уведомлений).
+
+        Общие ``counters`` считают всё подряд, включая хендлеры и фоновое обновление.
+        """
+        counters = RatesCounters()
+        token = _scoped_counters.set(counters)
+        try:
+            yield counters
+        finally:
+            _scoped_counters.reset(token)
+
+    def _count(self, lookups: int = 0, cache_hits: int = 0, upstream_requests: int = 0) -> None:
+        for counters in (self.counters, _scoped_counters.get()):
+            if counters is not None:
+                counters.lookups += lookups
+                counters.cache_hits += cache_hits
+                counters.upstream_requests += upstream_requests
+
     async def get_rate(self, base: str, quote: str) -> Optional[float]:
         base_u = base.upper()
         quote_u = quote.upper()
 
+        self._count(lookups=1)
         if base_u == quote_u:
+            self._count(cache_hits=1)
             return 1.0
 
+        matrix = await self._current_matrix()
+        if matrix is not None:
+            val = matrix.rate(base_u, quote_u)
+            if val is not None:
+                self._count(cache_hits=1)
+                return val
+
         if base_u in CRYPTO_BASES or quote_u in CRYPTO_BASES:
             val = await self._fetch_crypto_rate(base_u, quote_u)
             if val is not None:
@@ -31,48 +202,137 @@ class RatesService:
         # Fallback / fiat
         return await self._fetch_fiat_rate(base_u, quote_u)
 
-    async def _fetch_fiat_rate(self, base: str, quote: str) -> Optional[float]:
-        # Try multiple free APIs (no keys required)
-        apis = [
-            # exchangerate-api.com (no key) - основной
-            f"https://api.exchangerate-api.com/v4/latest/{base}",
-            # Alternative: currency-converter5.p.rapidapi.com (no key)
-            f"https://currency-converter5.p.rapidapi.com/currency/convert?format=json&from={base}&to={quote}&amount=1",
-            # Fallback: simple currency converter
-            f"https://api.exchangerate.host/latest?base={base}",
-        ]
-        
-        for i, url in enumerate(apis):
-            try:
-                r = await self._client.get(url)
-                r.raise_for_status()
-                data = r.json()
-                
-                if i == 0:  # exchangerate-api.com - основной
-                    rates = data.get("rates", {})
-                    if quote in rates:
-                        return float(rates[quote])
-                        
-                elif i == 1:  # currency-converter5 (может быть заблокирован)
-                    try:
-                        result = data.get("result")
-                        if result and "converted_amount" in result:
-                            return float(result["converted_amount"])
-                    except:
-                        pass
-                        
-                elif i == 2:  # exchangerate.host fallback (требует ключ)
-                    try:
-                        rates = data.get("rates", {})
-                        if rates and quote in rates:
-                            return float(rates[quote])
-                    except:
-                        pass
-                        
-            except Exception as e:
-                print(f"API {i+1} failed: {e}")
+    async def get_rates(
+        self, pairs: Iterable[Tuple[str, str]], concurrency: int = 8
+    ) -> Dict[Tuple[str, str], Optional[float]]:
+        """Курсы всех пар разом: попадания в матрицу - из памяти, промахи - через ``get_rate``
+        не больше ``concurrency`` одновременно. Ключи - пары в верхнем регистре; пара,
+        курс которой получить не удалось (в том числе из-за ошибки), даёт None.
+        """
+        matrix = await self._current_matrix()
+        result: Dict[Tuple[str, str], Optional[float]] = {}
+        misses: List[Tuple[str, str]] = []
+        for base, quote in pairs:
+            key = (base.upper(), quote.upper())
+            if key in result:
                 continue
-        
+            val = 1.0 if key[0] == key[1] else (matrix.rate(*key) if matrix is not None else None)
+            result[key] = val
+            if val is None:
+                misses.append(key)
+        # Промахи посчитает get_rate
+        hits = len(result) - len(misses)
+        self._count(lookups=hits, cache_hits=hits)
+        if misses:
+            sem = asyncio.Semaphore(max(1, concurrency))
+
+            async def resolve(base: str, quote: str) -> Optional[float]:
+                async with sem:
+                    try:
+                        return await self.get_rate(base, quote)
+                    except Exception:
+                        return None
+
+            vals = await asyncio.gather(*(resolve(b, q) for b, q in misses))
+            result.update(zip(misses, vals))
+        return result
+
+    def provider_stats(self) -> List[ProviderHealth]:
+        return self._router.stats()
+
+    @property
+    def matrix(self) -> Optional[RateMatrix]:
+        return self._matrix
+
+    def restore_matrix(
+        self, usd_values: Dict[str, float], updated_at: float, currency_times: Optional[Dict[str, float]] = None
+    ) -> bool:
+        # Снимок из БД (тёплый старт или курсы от другого процесса), если он новее текущего
+        if not usd_values or (self._matrix is not None and self._matrix.updated_at >= updated_at):
+            return False
+        matrix = RateMatrix(SUPPORTED_CURRENCIES, updated_at=updated_at)
+        for cur, value in usd_values.items():
+            matrix.set_usd(cur, value, (currency_times or {}).get(cur))
+        self._matrix = matrix
+        for feed in self._change_feeds:
+            feed.publish(matrix)
+        return True
+
+    def stale_since(self, *currencies: str) -> Optional[float]:
+        """Время получения самого старого курса среди ``currencies`` (по умолчанию - всех),
+        если он устарел (его провайдеры недоступны)."""
+        matrix = self._matrix
+        if matrix is None:
+            return None
+        oldest = matrix.oldest_update([c.upper() for c in currencies] if currencies else None)
+        if oldest is None or time.time() - oldest <= self._cache_ttl:
+            return None
+        return oldest
+
+    def add_change_feed(self, feed: RateChangeFeed) -> None:
+        self._change_feeds.append(feed)
+
+    def remove_change_feed(self, feed: RateChangeFeed) -> None:
+        if feed in self._change_feeds:
+            self._change_feeds.remove(feed)
+
+    def enable_background_refresh(self) -> None:
+        # Матрицу обновляет фоновая задача - хендлеры читают только из памяти
+        self._background_refresh = True
+
+    async def _current_matrix(self) -> Optional[RateMatrix]:
+        matrix = self._matrix
+        if matrix is not None:
+            if self._background_refresh:
+                return matrix
+            age = matrix.age()
+            if age <= self._cache_ttl:
+                return matrix
+            if age <= self._cache_ttl + self._cache_stale_ttl:
+                if not self._flight.in_flight("matrix"):
+                    self._spawn(self.refresh_matrix())
+                return matrix
+        return await self.refresh_matrix()
+
+    async def refresh_matrix(self) -> Optional[RateMatrix]:
+        return await self._flight.do("matrix", self._build_matrix)
+
+    async def _build_matrix(self) -> Optional[RateMatrix]:
+        # Один проход: таблица фиата от USD + цены всех монет (один запрос к CoinGecko)
+        usd_table, coin_tables = await asyncio.gather(
+            self._load_fiat_table("USD"),
+            self._load_coin_tables(),
+        )
+        matrix = RateMatrix(SUPPORTED_CURRENCIES)
+        if self._matrix is not None:
+            # Что не загрузилось (например, CoinGecko ответил 429), остаётся из прошлой матрицы со старым временем
+            matrix.merge(self._matrix)
+        loaded = 0
+        for cur, per_usd in (usd_table or {}).items():
+            if cur in FIAT_BASES and per_usd:
+                loaded += matrix.set_usd(cur, 1.0 / per_usd)
+        for cur, table in coin_tables.items():
+            if table.get("USD"):
+                loaded += matrix.set_usd(cur, table["USD"])
+        if not loaded:
+            # Ничего не загрузилось - оставляем прошлую матрицу
+            return self._matrix
+        matrix.set_usd("USD", 1.0)
+        self._matrix = matrix
+        for feed in self._change_feeds:
+            feed.publish(matrix)
+        return matrix
+
+    async def _fetch_fiat_rate(self, base: str, quote: str) -> Optional[float]:
+        table = await self._fiat_table(base)
+        if table is not None and quote in table:
+            return float(table[quote])
+
+        # Провайдеры отдельных пар (currency-converter5): результат в кэш не кладём
+        table = await self._fetch_first(self._pair_providers, base, quote)
+        if table is not None and quote in table.get(base, {}):
+            return table[base][quote]
+
         # Final fallback: try to get USD rates and cross-calculate
         if base != "USD" and quote != "USD":
             try:
@@ -82,59 +342,101 @@ class RatesService:
                     return base_usd / quote_usd
             except Exception:
                 pass
-                
+
+        return None
+
+    async def _fiat_table(self, base: str) -> Optional[Dict[str, float]]:
+        snap = self._snapshots.get(f"fiat:{base}")
+        if snap is not None:
+            if not self._snapshots.is_fresh(snap) and not self._flight.in_flight(f"fiat:{base}"):
+                self._spawn(self._load_fiat_table(base))
+            return snap.rates
+        return await self._load_fiat_table(base)
+
+    async def _load_fiat_table(self, base: str) -> Optional[Dict[str, float]]:
+        return await self._flight.do(f"fiat:{base}", lambda: self._download_fiat_table(base))
+
+    async def _download_fiat_table(self, base: str) -> Optional[Dict[str, float]]:
+        # Только то, что получено сейчас: старый снимок в матрицу попал бы с новым временем
+        tables = await self._fetch_first(self._fiat_providers, base)
+        if tables is not None and tables.get(base):
+            self._snapshots.put(f"fiat:{base}", tables[base])
+            return tables[base]
+        return None
+
+    async def _fetch_first(
+        self, providers: Dict[str, RateProvider], base: str, quote: Optional[str] = None
+    ) -> Optional[RateTable]:
+        # Провайдеры в порядке их наблюдаемого здоровья, первый успешный ответ
+        for name in self._router.order(providers):
+            provider = providers[name]
+            try:
+                return await self._router.call(
+                    name, lambda: provider.fetch(self._get_json, base, quote), is_failure=_is_provider_failure
+                )
+            except Exception:
+                continue
         return None
 
     async def _fetch_crypto_rate(self, base: str, quote: str) -> Optional[float]:
-        # coingecko simple price (no key)
-        # Needs ids, simple map for majors
-        symbol_to_id: Dict[str, str] = {
-            "BTC": "bitcoin",
-            "ETH": "ethereum",
-            "BNB": "binancecoin",
-            "XRP": "ripple",
-            "SOL": "solana",
-            "TON": "the-open-network",
-            "DOGE": "dogecoin",
-            "TRX": "tron",
-            "USDT": "tether",
-        }
-
-        if base in symbol_to_id and quote in symbol_to_id:
+        if base in COINGECKO_IDS and quote in COINGECKO_IDS:
             # crypto-to-crypto via USD pivot: base->USD and quote->USD
-            base_usd = await self._coingecko_simple(symbol_to_id[base], ["usd"]) or 0.0
-            quote_usd = await self._coingecko_simple(symbol_to_id[quote], ["usd"]) or 0.0
+            base_usd = (await self._coin_table(base)).get("USD", 0.0)
+            quote_usd = (await self._coin_table(quote)).get("USD", 0.0)
             if base_usd > 0 and quote_usd > 0:
                 return base_usd / quote_usd
 
-        if base in symbol_to_id:
-            target = quote.lower()
-            val = await self._coingecko_simple(symbol_to_id[base], [target])
+        if base in COINGECKO_IDS:
+            val = (await self._coin_table(base)).get(quote)
             if val is not None:
                 return val
 
-        if quote in symbol_to_id:
-            target = base.lower()
-            val = await self._coingecko_simple(symbol_to_id[quote], [target])
-            if val is not None and val != 0:
+        if quote in COINGECKO_IDS:
+            val = (await self._coin_table(quote)).get(base)
+            if val:
                 return 1.0 / val
         return None
 
-    async def _coingecko_simple(self, coin_id: str, vs: list[str]) -> Optional[float]:
-        vs_currencies = ",".join(vs)
-        url = f"https://api.coingecko.com/api/v3/simple/price?ids={coin_id}&vs_currencies={vs_currencies}"
-        try:
-            r = await self._client.get(url)
-            r.raise_for_status()
-            data = r.json()
-            price_block = data.get(coin_id, {})
-            # return the first requested currency value
-            for k in vs:
-                v = price_block.get(k)
-                if isinstance(v, (int, float)):
-                    return float(v)
-        except Exception:
-            return None
-        return None
+    async def _coin_table(self, symbol: str) -> Dict[str, float]:
+        snap = self._snapshots.get(f"coin:{symbol}")
+        if snap is not None:
+            if not self._snapshots.is_fresh(snap) and not self._flight.in_flight("coins"):
+                self._spawn(self._load_coin_tables())
+            return snap.rates
+        return (await self._load_coin_tables()).get(symbol, {})
+
+    async def _load_coin_tables(self) -> Dict[str, Dict[str, float]]:
+        return await self._flight.do("coins", self._download_coin_tables)
+
+    async def _download_coin_tables(self) -> Dict[str, Dict[str, float]]:
+        # coingecko simple price (no key): все монеты против всего фиата одним запросом
+        tables = await self._fetch_first(self._coin_providers, "USD") or {}
+        for symbol, table in tables.items():
+            self._snapshots.put(f"coin:{symbol}", table)
+        return tables
 
+    async def _get_json(self, url: str) -> Any:
+        # Одновременные запросы одного и того же URL идут одним HTTP-вызовом
+        return await self._flight.do(url, lambda: self._download_json(url))
 
+    async def _download_json(self, url: str) -> Any:
+        headers = {}
+        cached = self._validators.get(url) if self._conditional else None
+        if cached is not None:
+            etag, last_modified, _ = cached
+            if etag:
+                headers["If-None-Match"] = etag
+            if last_modified:
+                headers["If-Modified-Since"] = last_modified
+        self._count(upstream_requests=1)
+        r = await self._client.get(url, headers=headers)
+        if r.status_code == 304 and cached is not None:
+            return cached[2]
+        r.raise_for_status()
+        data = r.json()
+        if self._conditional:
+            etag = r.headers.get("ETag")
+            last_modified = r.headers.get("Last-Modified")
+            if etag or last_modified:
+                self._validators[url] = (etag, last_modified, data)
+        return data
@@ -0,0 +1,147 @@
+from __future__ import annotations
+
+import zlib
+from typing import List, Tuple
+
+from .alerts import AlertIndex, evaluate_crossings
+from .db import Database
+
+
+def shard_of(sub: dict, shards: int, key: str = "user") -> int:
+    """Детерминированный номер шарда подписки: по user_id или по паре."""
+    if shards <= 1:
+        return 0
+    if key == "pair":
+        token = f"{sub['base']}/{sub['quote']}"
+    else:
+        token = str(sub["user_id"])
+    return zlib.crc32(token.encode()) % shards
+
+
+class SubscriptionRegistry:
+    """Подписки в памяти, синхронизируемые с БД по журналу изменений.
+
+    Журнал ``subscription_changes`` пишут триггеры SQLite, поэтому
+    изменения из любого процесса видны всем: ``sync()`` читает только
+    записи новее последней применённой версии.
+
+    При ``shards > 1`` реестр держит только подписки своего шарда.
+    """
+
+    def __init__(
+        self, db: Database, keep_changes: int = 10000, shard: int = 0, shards: int = 1, shard_key: str = "user"
+    ) -> None:
+        self._db = db
+        self._keep_changes = keep_changes
+        self.shard = shard
+        self.shards = max(1, shards)
+        self.shard_key = shard_key
+        self.index = AlertIndex()
+        self.version = 0
+
+    def __len__(self) -> int:
+        return len(self.index)
+
+    async def load(self) -> None:
+        # Снимок читается порциями; словари создаются только для подписок своего шарда
+        subs, version = [], 0
+        async for version, chunk in self._db.iter_subscriptions_snapshot():
+            subs.extend(sub.as_dict() for sub in chunk if self.owns(sub))
+        index = AlertIndex()
+        index.load(subs)
+        self.index = index
+        self.version = version
+
+    def owns(self, sub: dict) -> bool:
+        return shard_of(sub, self.shards, self.shard_key) == self.shard
+
+    def pairs(self) -> List[Tuple[str, str]]:
+        return self.index.pairs()
+
+    async def crossings(
+        self, pair: Tuple[str, str], value: float, now: float, hysteresis: float = 0.0, cooldown: float = 0.0
+    ) -> Tuple[List[dict], List[dict], int]:
+        """(сработавшие, снова взведённые, число проверенных подписок - кандидатов из индекса)."""
+        return self.index.crossings(pair, value, now, hysteresis, cooldown)
+
+    async def sync(self) -> bool:
+        """Применить новые изменения; True, если набор подписок поменялся."""
+        latest, oldest, changed, removed = await self._db.subscription_changes_since(self.version)
+        if latest == self.version:
+            return False
+        if oldest is not None and oldest > self.version + 1:
+            # Нужная часть журнала уже удалена - перечитываем всё
+            await self.load()
+            return True
+        for sub_id in removed:
+            self.index.remove(sub_id)
+        for sub in changed:
+            if self.owns(sub):
+                self.index.add(sub)
+            else:
+                self.index.remove(sub["id"])
+        self.version = latest
+        if latest - self._keep_changes > (oldest or 0):
+            await self._db.prune_subscription_changes(latest - self._keep_changes)
+        return True
+
+
+class SqlSubscriptionMatcher:
+    """Проверка подписок запросами к БД, без копии таблицы в памяти.
+
+    Тот же интерфейс, что у ``SubscriptionRegistry``, но на каждую пару
+    из БД читаются только подписки, чьё условие выполняется, и сработавшие,
+    которые могут взвестись - range scan по индексу ``idx_subscriptions_alerts``.
+    Подходит для больших таблиц, когда держать реестр в памяти дорого.
+    """
+
+    def __init__(
+        self, db: Database, keep_changes: int = 10000, shard: int = 0, shards: int = 1, shard_key: str = "user"
+    ) -> None:
+        self._db = db
+        self._keep_changes = keep_changes
+        self.shard = shard
+        self.shards = max(1, shards)
+        self.shard_key = shard_key
+        self.version = 0
+        self._pairs: List[Tuple[str, str]] = []
+
+    async def load(self) -> None:
+        _, self.version = await self._db.subscription_journal_bounds()
+        await self._load_pairs()
+
+    async def _load_pairs(self) -> None:
+        pairs = await self._db.subscription_pairs()
+        if self.shard_key == "pair":
+            pairs = [p for p in pairs if self._owns_pair(p)]
+        self._pairs = pairs
+
+    def _owns_pair(self, pair: Tuple[str, str]) -> bool:
+        return shard_of({"base": pair[0], "quote": pair[1]}, self.shards, "pair") == self.shard
+
+    def owns(self, sub: dict) -> bool:
+        return shard_of(sub, self.shards, self.shard_key) == self.shard
+
+    def pairs(self) -> List[Tuple[str, str]]:
+        return list(self._pairs)
+
+    async def sync(self) -> bool:
+        """Перечитать список пар, если подписки менялись с прошлого раза."""
+        oldest, latest = await self._db.subscription_journal_bounds()
+        if latest == self.version:
+            return False
+        await self._load_pairs()
+        self.version = latest
+        if latest - self._keep_changes > (oldest or 0):
+            await self._db.prune_subscription_changes(latest - self._keep_changes)
+        return True
+
+    async def crossings(
+        self, pair: Tuple[str, str], value: float, now: float, hysteresis: float = 0.0, cooldown: float = 0.0
+    ) -> Tuple[List[dict], List[dict], int]:
+        matching, triggered = await self._db.alert_candidates(pair[0], pair[1], value, hysteresis)
+        if self.shards > 1 and self.shard_key != "pair":
+            matching = [sub for sub in matching if self.owns(sub)]
+            triggered = [sub for sub in triggered if self.owns(sub)]
+        fired, rearmed = evaluate_crossings(matching, triggered, value, now, hysteresis, cooldown)
+        return fired, rearmed, len(matching) + len(triggered)
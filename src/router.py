@@ -0,0 +1,110 @@
+from __future__ import annotations
+
+import logging
+import time
+from dataclasses import dataclass
+from typing import Awaitable, Callable, Dict, Iterable, List, Optional, TypeVar
+
+
+T = TypeVar("T")
+
+logger = logging.getLogger("quickconverter.rates")
+
+
+class CircuitOpenError(Exception):
+    pass
+
+
+@dataclass
+class ProviderHealth:
+    name: str
+    calls: int = 0
+    latency: float = 0.0
+    success: float = 1.0
+    failures: int = 0
+    opened_at: Optional[float] = None
+    probing: bool = False
+
+    def score(self) -> float:
+        # Чем меньше, тем лучше: быстрые и надёжные провайдеры идут первыми.
+        # Ещё не вызывавшиеся - в конец, в порядке объявления (sorted стабилен)
+        if self.calls == 0:
+            return float("inf")
+        return self.latency / max(self.success, 0.05)
+
+
+class ProviderRouter:
+    """Выбирает порядок провайдеров по EWMA задержки и доле успехов.
+
+    После ``failure_threshold`` ошибок подряд провайдер выключается
+    (circuit open); через ``reset_timeout`` секунд пропускается один
+    пробный запрос (half-open), успех снова его включает.
+    """
+
+    def __init__(self, failure_threshold: int = 3, reset_timeout: float = 60, alpha: float = 0.2) -> None:
+        self._failure_threshold = max(1, failure_threshold)
+        self._reset_timeout = reset_timeout
+        self._alpha = alpha
+        self._health: Dict[str, ProviderHealth] = {}
+
+    def health(self, name: str) -> ProviderHealth:
+        h = self._health.get(name)
+        if h is None:
+            h = self._health[name] = ProviderHealth(name=name)
+        return h
+
+    def stats(self) -> List[ProviderHealth]:
+        return list(self._health.values())
+
+    def is_available(self, name: str) -> bool:
+        h = self.health(name)
+        if h.opened_at is None:
+            return True
+        return not h.probing and time.monotonic() - h.opened_at >= self._reset_timeout
+
+    def order(self, names: Iterable[str]) -> List[str]:
+        available = [n for n in names if self.is_available(n)]
+        return sorted(available, key=lambda n: self.health(n).score())
+
+    async def call(
+        self,
+        name: str,
+        fn: Callable[[], Awaitable[T]],
+        is_failure: Optional[Callable[[Exception], bool]] = None,
+    ) -> T:
+        h = self.health(name)
+        if not self.is_available(name):
+            raise CircuitOpenError(name)
+        if h.opened_at is not None:
+            h.probing = True
+        started = time.monotonic()
+        try:
+            result = await fn()
+        except Exception as e:
+            # Ошибки, которые не говорят о здоровье провайдера, считаются обычным ответом
+            ok = is_failure is not None and not is_failure(e)
+            self._record(h, time.monotonic() - started, ok=ok)
+            raise
+        except BaseException:
+            h.probing = False
+            raise
+        self._record(h, time.monotonic() - started, ok=True)
+        return result
+
+    def _record(self, h: ProviderHealth, latency: float, ok: bool) -> None:
+        a = self._alpha
+        h.latency = latency if h.calls == 0 else (1 - a) * h.latency + a * latency
+        h.calls += 1
+        h.success = (1 - a) * h.success + a * (1.0 if ok else 0.0)
+        h.probing = False
+        if ok:
+            if h.opened_at is not None:
+                logger.info("provider %s recovered", h.name)
+            h.failures = 0
+            h.opened_at = None
+            return
+        h.failures += 1
+        if h.opened_at is not None or h.failures >= self._failure_threshold:
+            if h.opened_at is None:
+                logger.warning("provider %s disabled after %d failures", h.name, h.failures)
+            h.opened_at = time.monotonic()
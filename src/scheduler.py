@@ -1,50 +1,242 @@
 from __future__ import annotations
 
 import asyncio
-from typing import Callable
+import time
+from dataclasses import replace
+from typing import Callable, Dict, Optional, Tuple, Union
 
 from aiogram import Bot
 
+from .changes import RateChangeFeed
 from .db import Database
+from .delivery import DeliveryQueue, DigestBuffer
+from .history import RateHistory
 from .rates import RatesService
-from .config import get_settings
+from .registry import SqlSubscriptionMatcher, SubscriptionRegistry
+from .stats import NotifierStats, TickStats, logger
+from .config import Settings, get_settings
 
 
-def _compare(value: float, op: str, threshold: float) -> bool:
-    if op == ">":
-        return value > threshold
-    if op == ">=":
-        return value >= threshold
-    if op == "<":
-        return value < threshold
-    if op == "<=":
-        return value <= threshold
-    if op == "==":
-        return abs(value - threshold) < 1e-12
-    return False
+# Статистика уведомлений текущего процесса (логируется каждый тик)
+notifier_stats = NotifierStats()
 
 
-async def run_notifier(bot: Bot, db: Database, rates: RatesService):
+async def run_notifier(
+    bot: Bot,
+    db: Database,
+    rates: RatesService,
+    shard: int = 0,
+    shards: int = 1,
+    stats: Optional[NotifierStats] = None,
+):
     settings = get_settings()
-    interval = settings.scheduler_interval_seconds
-    while True:
+    # sql: подписки не держим в памяти, сработавшие ищем запросом по индексу
+    registry_cls = SqlSubscriptionMatcher if settings.notifier_matching == "sql" else SubscriptionRegistry
+    registry = registry_cls(db, shard=shard, shards=shards, shard_key=settings.notifier_shard_key)
+    await registry.load()
+    if shards > 1 and settings.notifier_shard_key == "pair":
+        logger.warning(
+            "NOTIFIER_SHARD_KEY=pair: one user's alerts may go out from several shards, "
+            "bypassing per-chat spacing and digest grouping"
+        )
+    delivery = DeliveryQueue(
+        bot,
+        workers=settings.delivery_workers,
+        # Все шарды пишут от одного бота: общий лимит Telegram делится между процессами
+        global_rate=settings.delivery_global_rate / max(1, shards),
+        per_chat_rate=settings.delivery_per_chat_rate,
+        max_queue=settings.delivery_queue_size,
+        max_retries=settings.delivery_max_retries,
+    )
+    delivery.start()
+    digest = DigestBuffer(delivery, settings.digest_window_seconds)
+    notifier = _Notifier(settings, db, rates, registry, delivery, digest, stats or notifier_stats)
+    try:
+        await notifier.run()
+    finally:
+        await digest.flush(force=True)
+        await delivery.close()
+
+
+class _Notifier:
+    def __init__(
+        self,
+        settings: Settings,
+        db: Database,
+        rates: RatesService,
+        registry: Union[SubscriptionRegistry, SqlSubscriptionMatcher],
+        delivery: DeliveryQueue,
+        digest: DigestBuffer,
+        stats: NotifierStats,
+    ) -> None:
+        self.settings = settings
+        self.db = db
+        self.rates = rates
+        self.registry = registry
+        self.delivery = delivery
+        self.digest = digest
+        self.stats = stats
+        self._delivery_seen = replace(delivery.stats)
+
+    def _wake_at(self, next_tick: float) -> float:
+        deadline = self.digest.next_deadline()
+        return next_tick if deadline is None else min(next_tick, deadline)
+
+    async def run(self) -> None:
+        interval = self.settings.scheduler_interval_seconds
+        feed: Optional[RateChangeFeed] = None
+        if self.settings.notifier_mode == "event":
+            feed = RateChangeFeed(self.settings.rate_change_epsilon)
+            self.rates.add_change_feed(feed)
+        next_tick = time.monotonic()
         try:
-            subs = await db.all_subscriptions()
-            for sub in subs:
-                rate = await rates.get_rate(sub["base"], sub["quote"])
+            while True:
+                try:
+                    # Одна синхронизация на итерацию: до watch, чтобы следить и за новыми парами
+                    sync_started = time.perf_counter()
+                    await self.registry.sync()
+                    sync_time = time.perf_counter() - sync_started
+                    changed: Dict[Tuple[str, str], Optional[float]] = {}
+                    if feed is not None:
+                        # Ждём изменения курсов, но не дольше чем до следующего планового тика
+                        feed.watch(self.registry.pairs())
+                        changed = dict(await feed.wait(max(0.0, self._wake_at(next_tick) - time.monotonic())))
+                    if changed:
+                        await self._tick("event", changed, lag=0.0, budget=interval, sync_time=sync_time)
+                        continue
+                    if feed is None:
+                        await asyncio.sleep(max(0.0, self._wake_at(next_tick) - time.monotonic()))
+                    if time.monotonic() < next_tick:
+                        # Проснулись ради окна дайджеста, до планового тика ещё далеко
+                        await self.digest.flush()
+                        continue
+                    # Плановый тик: все пары, включая отсутствующие в матрице
+                    lag = time.monotonic() - next_tick
+                    next_tick = max(next_tick + interval, time.monotonic())
+                    await self._tick("tick", None, lag=lag, budget=interval, sync_time=sync_time)
+                except Exception as e:
+                    logger.exception("notifier tick failed: %s", e)
+                    await asyncio.sleep(interval)
+        finally:
+            if feed is not None:
+                self.rates.remove_change_feed(feed)
+
+    async def _tick(
+        self,
+        kind: str,
+        pair_rates: Optional[Dict[Tuple[str, str], Optional[float]]],
+        lag: float,
+        budget: float,
+        sync_time: float = 0.0,
+    ) -> None:
+        tick = TickStats(kind=kind, lag=lag)
+        # Реестр синхронизирован в начале итерации (run), здесь только учитываем время
+        tick.phases["sync"] = sync_time
+        started = time.perf_counter() - sync_time
+
+        if pair_rates is None:
+            # Считаем только запросы этого тика, без хендлеров и фонового обновления курсов
+            with tick.phase("rates"), self.rates.scoped_counters() as counters:
+                pair_rates = await self.rates.get_rates(
+                    self.registry.pairs(), self.settings.notifier_rate_concurrency
+                )
+            tick.rate_lookups = counters.lookups
+            tick.rate_cache_hits = counters.cache_hits
+            tick.upstream_requests = counters.upstream_requests
+
+        now = time.time()
+        changed = []
+        with tick.phase("compare"):
+            for pair, rate in pair_rates.items():
                 if rate is None:
                     continue
-                if _compare(rate, sub["operator"], sub["threshold"]):
-                    text = (
-                        f"Сработало условие: {sub['base']}/{sub['quote']} "
-                        f"{sub['operator']} {sub['threshold']} (текущий: {rate:.6g})"
+                tick.pairs += 1
+                fired, rearmed, evaluated = await self.registry.crossings(
+                    pair, rate, now, self.settings.alert_hysteresis, self.settings.alert_cooldown_seconds
+                )
+                tick.evaluated += evaluated
+                tick.triggered += len(fired)
+                tick.rearmed += len(rearmed)
+                changed.extend(fired)
+                changed.extend(rearmed)
+                for sub in fired:
+                    self.digest.add(
+                        sub["user_id"],
+                        f"{sub['base']}/{sub['quote']} {sub['operator']} {sub['threshold']} (текущий: {rate:.6g})",
                     )
-                    try:
-                        await bot.send_message(sub["user_id"], text)
-                    except Exception:
-                        pass
-        except Exception:
-            pass
-        await asyncio.sleep(interval)
+        with tick.phase("persist"):
+            await self.db.save_alert_states(changed)
+        with tick.phase("send"):
+            tick.messages_queued = await self.digest.flush()
 
+        tick.duration = time.perf_counter() - started
+        tick.overrun = tick.duration > budget
+        # Отправка асинхронна: считаем всё, что воркеры доставили с прошлого тика
+        delivery = replace(self.delivery.stats)
+        tick.send_ok = delivery.sent - self._delivery_seen.sent
+        tick.send_failed = delivery.failed - self._delivery_seen.failed
+        self._delivery_seen = delivery
+        self.stats.record(tick)
 
+
+async def run_rates_refresher(rates: RatesService, db: Database, history: Optional[RateHistory] = None):
+    settings = get_settings()
+    interval = settings.rates_refresh_interval_seconds
+    rates.enable_background_refresh()
+    saved_at = None
+    while True:
+        started = time.monotonic()
+        try:
+            matrix = await rates.refresh_matrix()
+            if matrix is not None and matrix.updated_at != saved_at:
+                await db.save_rate_snapshot(matrix.values(), matrix.updated_at, matrix.updated_times())
+                saved_at = matrix.updated_at
+                if history is not None:
+                    await history.record(matrix)
+        except Exception as e:
+            logger.exception("rates refresh failed: %s", e)
+        await asyncio.sleep(max(0.0, interval - (time.monotonic() - started)))
+
+
+async def run_snapshot_follower(rates: RatesService, db: Database):
+    # Для отдельных процессов уведомлений: курсы берём из снимка в БД,
+    # который пишет run_rates_refresher бота; к провайдерам идём, только если он устарел
+    settings = get_settings()
+    interval = settings.rates_refresh_interval_seconds
+    rates.enable_background_refresh()
+    while True:
+        started = time.monotonic()
+        try:
+            usd_values, updated_at, currency_times = await db.load_rate_snapshot()
+            if updated_at is not None:
+                rates.restore_matrix(usd_values, updated_at, currency_times)
+            # Сами идём к провайдерам, только если бот перестал обновлять снимок целиком
+            if rates.matrix is None or rates.matrix.age() > settings.rates_cache_ttl_seconds:
+                await rates.refresh_matrix()
+        except Exception as e:
+            logger.exception("rates snapshot load failed: %s", e)
+        await asyncio.sleep(max(0.0, interval - (time.monotonic() - started)))
+
+
+async def run_notifier_worker(shard: int, shards: int):
+    """Отдельный процесс уведомлений для шарда ``shard`` из ``shards`` (см. run_notifier.py)."""
+    settings = get_settings()
+    bot = Bot(token=settings.bot_token)
+    db = Database.from_settings(settings)
+    await db.init()
+    rates = RatesService.from_settings(settings)
+    usd_values, updated_at, currency_times = await db.load_rate_snapshot()
+    if updated_at is not None:
+        rates.restore_matrix(usd_values, updated_at, currency_times)
+    follower = asyncio.create_task(run_snapshot_follower(rates, db))
+    try:
+        await run_notifier(bot, db, rates, shard=shard, shards=shards)
+    finally:
+        follower.cancel()
+        try:
+            await follower
+        except (asyncio.CancelledError, Exception):
+            pass
+        await rates.close()
+        await db.close()
+        await bot.session.close()
@@ -0,0 +1,88 @@
+from __future__ import annotations
+
+import logging
+import time
+from collections import deque
+from contextlib import contextmanager
+from dataclasses import asdict, dataclass, field
+from typing import Deque, Dict, Iterator, List, Optional
+
+
+logger = logging.getLogger("quickconverter.notifier")
+
+
+@dataclass
+class TickStats:
+    kind: str
+    started_at: float = field(default_factory=time.time)
+    lag: float = 0.0
+    duration: float = 0.0
+    overrun: bool = False
+    phases: Dict[str, float] = field(default_factory=dict)
+    pairs: int = 0
+    # Подписки-кандидаты, прочитанные для проверки (из AlertIndex или запросом к БД)
+    evaluated: int = 0
+    triggered: int = 0
+    rearmed: int = 0
+    rate_lookups: int = 0
+    rate_cache_hits: int = 0
+    upstream_requests: int = 0
+    messages_queued: int = 0
+    send_ok: int = 0
+    send_failed: int = 0
+
+    @contextmanager
+    def phase(self, name: str) -> Iterator[None]:
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.phases[name] = self.phases.get(name, 0.0) + time.perf_counter() - started
+
+    def as_dict(self) -> dict:
+        return asdict(self)
+
+
+class NotifierStats:
+    """Статистика тиков планировщика: последние ``history`` тиков и итоги."""
+
+    def __init__(self, history: int = 1000) -> None:
+        self.ticks: Deque[TickStats] = deque(maxlen=history)
+        self.total_ticks = 0
+        self.total_overruns = 0
+        self.total_triggered = 0
+
+    @property
+    def last(self) -> Optional[TickStats]:
+        return self.ticks[-1] if self.ticks else None
+
+    def record(self, tick: TickStats) -> None:
+        self.ticks.append(tick)
+        self.total_ticks += 1
+        self.total_overruns += tick.overrun
+        self.total_triggered += tick.triggered
+        logger.info(
+            "tick kind=%s duration=%.3fs lag=%.3fs overrun=%s pairs=%d evaluated=%d triggered=%d rearmed=%d "
+            "lookups=%d cache_hits=%d upstream=%d queued=%d sent=%d failed=%d phases=%s",
+            tick.kind, tick.duration, tick.lag, tick.overrun, tick.pairs, tick.evaluated, tick.triggered,
+            tick.rearmed, tick.rate_lookups, tick.rate_cache_hits, tick.upstream_requests, tick.messages_queued,
+            tick.send_ok, tick.send_failed,
+            ",".join(f"{k}={v * 1000:.1f}ms" for k, v in tick.phases.items()),
+        )
+
+    def percentile(self, metric: str, p: float) -> float:
+        values: List[float] = sorted(getattr(t, metric) for t in self.ticks)
+        if not values:
+            return 0.0
+        return values[min(len(values) - 1, round(p / 100 * (len(values) - 1)))]
+
+    def summary(self) -> dict:
+        return {
+            "ticks": self.total_ticks,
+            "overruns": self.total_overruns,
+            "triggered": self.total_triggered,
+            "duration_p50": self.percentile("duration", 50),
+            "duration_p99": self.percentile("duration", 99),
+            "lag_p99": self.percentile("lag", 99),
+            "last": self.last.as_dict() if self.last else None,
+        }
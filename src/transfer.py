@@ -0,0 +1,158 @@
+"""Импорт и экспорт подписок в CSV / JSON Lines для переноса между базами.
+
+    python -m src.transfer export subs.csv
+    python -m src.transfer import subs.jsonl --db data/other.sqlite3
+
+Файлы читаются и пишутся построчно, в базу подписки уходят пачками
+через ``add_subscriptions_many`` - по транзакции на пачку.
+"""
+from __future__ import annotations
+
+import argparse
+import asyncio
+import csv
+import json
+import logging
+import math
+import os
+import re
+import sys
+from typing import Iterator, List, Optional, Tuple, Union
+
+from dotenv import load_dotenv
+
+from .db import Database
+
+
+logger = logging.getLogger("quickconverter.transfer")
+
+
+FIELDS = ("user_id", "base", "quote", "operator", "threshold")
+OPERATORS = {">", ">=", "<", "<=", "=="}
+# Как в parse_alert: код валюты - 2-6 латинских букв
+CURRENCY_RE = re.compile(r"^[A-Z]{2,6}$")
+
+SubscriptionTuple = Tuple[int, str, str, str, float]
+
+
+def _format(path: str, fmt: Optional[str]) -> str:
+    if fmt is None:
+        fmt = "csv" if path.lower().endswith(".csv") else "jsonl"
+    if fmt not in ("csv", "jsonl"):
+        raise ValueError(f"Unknown format: {fmt}")
+    return fmt
+
+
+def _field(record: dict, name: str) -> str:
+    # Нет колонки в CSV или null в JSON - ошибка записи, а не строка "None"
+    value = record[name]
+    if value is None:
+        raise ValueError(f"missing {name}")
+    return str(value).strip()
+
+
+def _currency(record: dict, name: str) -> str:
+    code = _field(record, name).upper()
+    if not CURRENCY_RE.match(code):
+        raise ValueError(f"bad {name} {code!r}")
+    return code
+
+
+def _parse(raw: Union[dict, str]) -> SubscriptionTuple:
+    record = json.loads(raw) if isinstance(raw, str) else raw
+    if not isinstance(record, dict):
+        raise ValueError("record is not an object")
+    operator = _field(record, "operator")
+    if operator not in OPERATORS:
+        raise ValueError(f"bad operator {operator!r}")
+    threshold = float(_field(record, "threshold"))
+    if not math.isfinite(threshold):
+        raise ValueError(f"bad threshold {threshold!r}")
+    return (
+        int(_field(record, "user_id")),
+        _currency(record, "base"),
+        _currency(record, "quote"),
+        operator,
+        threshold,
+    )
+
+
+def _read_records(path: str, fmt: str) -> Iterator[Union[dict, str]]:
+    # Строки JSON Lines разбирает _parse, чтобы одна битая строка не обрывала импорт
+    with open(path, newline="", encoding="utf-8") as f:
+        if fmt == "csv":
+            yield from csv.DictReader(f)
+        else:
+            for line in f:
+                if line.strip():
+                    yield line
+
+
+async def import_subscriptions(db: Database, path: str, fmt: Optional[str] = None, batch_size: int = 1000) -> Tuple[int, int]:
+    """Загрузить подписки из файла; возвращает (добавлено, пропущено строк с ошибками)."""
+    fmt = _format(path, fmt)
+    added = skipped = 0
+    batch: List[SubscriptionTuple] = []
+    for lineno, record in enumerate(_read_records(path, fmt), start=1):
+        try:
+            batch.append(_parse(record))
+        except (KeyError, TypeError, ValueError) as e:
+            logger.warning("skipping record %d: %s", lineno, e)
+            skipped += 1
+            continue
+        if len(batch) >= batch_size:
+            added += await db.add_subscriptions_many(batch)
+            batch = []
+    added += await db.add_subscriptions_many(batch)
+    return added, skipped
+
+
+async def export_subscriptions(db: Database, path: str, fmt: Optional[str] = None) -> int:
+    """Выгрузить все подписки в файл; возвращает их число."""
+    fmt = _format(path, fmt)
+    count = 0
+    with open(path, "w", newline="", encoding="utf-8") as f:
+        writer = csv.writer(f) if fmt == "csv" else None
+        if writer is not None:
+            writer.writerow(FIELDS)
+        async for sub in db.iter_subscriptions():
+            row = [getattr(sub, name) for name in FIELDS]
+            if writer is not None:
+                writer.writerow(row)
+            else:
+                f.write(json.dumps(dict(zip(FIELDS, row)), ensure_ascii=False) + "\n")
+            count += 1
+    return count
+
+
+async def _main(args: argparse.Namespace) -> None:
+    db = Database(args.db)
+    await db.init()
+    try:
+        if args.command == "export":
+            count = await export_subscriptions(db, args.path, args.format)
+            print(f"Exported {count} subscriptions to {args.path}")
+        else:
+            added, skipped = await import_subscriptions(db, args.path, args.format, args.batch_size)
+            print(f"Imported {added} subscriptions from {args.path}, skipped {skipped}")
+    finally:
+        await db.close()
+
+
+def main() -> int:
+    load_dotenv()
+    parser = argparse.ArgumentParser(description="Import/export QuickConverterBot subscriptions")
+    parser.add_argument("command", choices=("import", "export"))
+    parser.add_argument("path", help="файл .csv или .jsonl")
+    parser.add_argument("--format", choices=("csv", "jsonl"), help="по умолчанию - по расширению файла")
+    parser.add_argument("--db", default=os.getenv("DATABASE_PATH", "data/db.sqlite3"))
+    parser.add_argument("--batch-size", type=int, default=1000)
+    args = parser.parse_args()
+    # Пропущенные записи импорт пишет в лог - в CLI это stderr
+    logging.basicConfig(level=logging.INFO, format="%(levelname)s: %(message)s")
+    asyncio.run(_main(args))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
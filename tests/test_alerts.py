@@ -0,0 +1,205 @@
+import asyncio
+import copy
+import random
+
+import pytest
+
+from src.alerts import BULK_MOVE, AlertIndex, evaluate_crossings, rearm_bounds, rearmed
+from src.db import Database
+
+
+OPERATORS = [">", ">=", "<", "<=", "=="]
+PAIR = ("USD", "EUR")
+
+
+def _sub(sub_id, op, threshold, user_id=1):
+    return {
+        "id": sub_id,
+        "user_id": user_id,
+        "base": PAIR[0],
+        "quote": PAIR[1],
+        "operator": op,
+        "threshold": threshold,
+        "triggered": 0,
+        "last_fired_at": None,
+    }
+
+
+def _ids(subs):
+    return sorted(sub["id"] for sub in subs)
+
+
+async def _sql_crossings(db, value, now, hysteresis, cooldown):
+    matching, triggered = await db.alert_candidates(PAIR[0], PAIR[1], value, hysteresis)
+    fired, rearmed = evaluate_crossings(matching, triggered, value, now, hysteresis, cooldown)
+    await db.save_alert_states(fired + rearmed)
+    return fired, rearmed, len(matching) + len(triggered)
+
+
+def _run_both(tmp_path, subs, steps, hysteresis=0.0, cooldown=0.0, evaluated=None):
+    """Прогоняет последовательность (курс, время) через AlertIndex и через SQL; возвращает шаги обоих.
+
+    В ``evaluated`` (если передан) добавляются пары (проверено в памяти, проверено в SQL).
+    """
+
+    async def run():
+        db = Database(str(tmp_path / "alerts.sqlite3"))
+        await db.init()
+        try:
+            await db.add_subscriptions_many(
+                [(s["user_id"], s["base"], s["quote"], s["operator"], s["threshold"]) for s in subs]
+            )
+            index = AlertIndex()
+            index.load(await db.all_subscriptions())
+            memory, sql = [], []
+            for value, now in steps:
+                fired, rearmed, in_memory = index.crossings(PAIR, value, now, hysteresis, cooldown)
+                memory.append((_ids(fired), _ids(rearmed)))
+                fired, rearmed, in_sql = await _sql_crossings(db, value, now, hysteresis, cooldown)
+                sql.append((_ids(fired), _ids(rearmed)))
+                if evaluated is not None:
+                    evaluated.append((in_memory, in_sql))
+            return memory, sql
+        finally:
+            await db.close()
+
+    return asyncio.run(run())
+
+
+@pytest.mark.parametrize(
+    "op, value, expected",
+    [
+        (">", 100.0, False),
+        (">", 100.0000001, True),
+        (">=", 100.0, True),
+        (">=", 99.9999999, False),
+        ("<", 100.0, False),
+        ("<", 99.9999999, True),
+        ("<=", 100.0, True),
+        ("<=", 100.0000001, False),
+        ("==", 100.0, True),
+        ("==", 100.0000001, False),
+    ],
+)
+def test_boundaries_match_in_memory_and_sql(tmp_path, op, value, expected):
+    # Пороги вокруг границы, чтобы задеть bisect_left/bisect_right в колонке индекса
+    subs = [_sub(1, op, 99.0), _sub(2, op, 100.0), _sub(3, op, 100.0), _sub(4, op, 101.0)]
+    memory, sql = _run_both(tmp_path, subs, [(value, 0.0)])
+    assert memory == sql
+    fired = memory[0][0]
+    assert (2 in fired) is expected
+    assert (3 in fired) is expected
+
+
+def test_edge_trigger_fires_once_until_rearmed(tmp_path):
+    subs = [_sub(1, ">", 100.0)]
+    steps = [(101.0, 0.0), (102.0, 1.0), (99.0, 2.0), (101.0, 3.0)]
+    memory, sql = _run_both(tmp_path, subs, steps)
+    assert memory == sql
+    assert memory == [([1], []), ([], []), ([], [1]), ([1], [])]
+
+
+def test_hysteresis_requires_margin_to_rearm(tmp_path):
+    subs = [_sub(1, ">", 100.0), _sub(2, "<", 100.0)]
+    # Запас 1%: ">" взводится ниже 99, "<" - выше 101
+    steps = [(101.0, 0.0), (99.5, 1.0), (98.9, 2.0), (100.5, 3.0), (101.5, 4.0)]
+    memory, sql = _run_both(tmp_path, subs, steps, hysteresis=0.01)
+    assert memory == sql
+    assert memory[0] == ([1], [])
+    assert memory[1] == ([2], [])
+    assert memory[2] == ([], [1])
+    assert memory[3] == ([1], [])
+    assert memory[4] == ([], [2])
+
+
+def test_cooldown_suppresses_repeat_fire(tmp_path):
+    subs = [_sub(1, ">=", 100.0)]
+    steps = [(100.0, 0.0), (99.0, 10.0), (100.0, 20.0), (99.0, 30.0), (100.0, 70.0)]
+    memory, sql = _run_both(tmp_path, subs, steps, cooldown=60.0)
+    assert memory == sql
+    assert [fired for fired, _ in memory] == [[1], [], [], [], [1]]
+
+
+def test_random_sequences_match(tmp_path):
+    rnd = random.Random(7)
+    subs = [
+        _sub(i, rnd.choice(OPERATORS), float(rnd.randrange(95, 106)), user_id=rnd.randrange(50))
+        for i in range(1, 401)
+    ]
+    steps = [(float(rnd.randrange(93, 108)) + rnd.choice([0.0, 0.5]), float(t)) for t in range(60)]
+    evaluated = []
+    memory, sql = _run_both(tmp_path, copy.deepcopy(subs), steps, hysteresis=0.005, cooldown=3.0, evaluated=evaluated)
+    assert memory == sql
+    # Оба режима считают одно и то же: прочитанных кандидатов, а не все подписки пары
+    assert all(in_memory == in_sql for in_memory, in_sql in evaluated)
+    assert max(in_memory for in_memory, _ in evaluated) < len(subs)
+    assert any(fired for fired, _ in memory)
+    assert any(rearmed for _, rearmed in memory)
+
+
+def test_large_crossings_move_whole_columns(tmp_path):
+    # Курс ходит через все пороги сразу: колонки перестраиваются слиянием, а не вставками по одной
+    rnd = random.Random(3)
+    subs = [_sub(i, rnd.choice(OPERATORS[:4]), float(rnd.randrange(95, 106))) for i in range(1, 2001)]
+    steps = [(90.0, 0.0), (110.0, 1.0), (100.0, 2.0), (90.0, 3.0), (100.5, 4.0), (110.0, 5.0)]
+    memory, sql = _run_both(tmp_path, subs, steps)
+    assert memory == sql
+    assert max(len(fired) for fired, _ in memory) >= 4 * BULK_MOVE
+
+
+def test_load_matches_incremental_adds():
+    rnd = random.Random(5)
+    subs = [_sub(i, rnd.choice(OPERATORS), float(rnd.randrange(95, 106))) for i in range(1, 501)]
+    for sub in subs[::3]:
+        sub["triggered"] = 1
+    loaded, added = AlertIndex(), AlertIndex()
+    loaded.load(copy.deepcopy(subs))
+    for sub in copy.deepcopy(subs):
+        added.add(sub)
+    for value in (94.0, 100.0, 100.5, 107.0):
+        assert _ids(loaded.matching(PAIR, value)) == _ids(added.matching(PAIR, value))
+        assert _ids(loaded.rearm_candidates(PAIR, value)) == _ids(added.rearm_candidates(PAIR, value))
+    assert loaded.count(PAIR) == added.count(PAIR) == len(subs)
+
+
+@pytest.mark.parametrize("hysteresis", [0.0, 0.001, 0.01, 0.3])
+def test_rearm_bounds_never_miss_a_rearm(hysteresis):
+    rnd = random.Random(11)
+    for _ in range(3000):
+        op = rnd.choice(OPERATORS)
+        threshold = rnd.choice([rnd.uniform(-200, 200), float(rnd.randrange(-5, 6)), 0.0])
+        value = rnd.choice([threshold, threshold * (1 + hysteresis), threshold * (1 - hysteresis), rnd.uniform(-200, 200)])
+        if rearmed(value, op, threshold, hysteresis):
+            lo, hi = rearm_bounds(op, value, hysteresis)
+            assert threshold <= lo or threshold >= hi, (op, threshold, value)
+
+
+def test_long_triggered_subscriptions_are_not_rechecked():
+    index = AlertIndex()
+    for i in range(1, 1001):
+        index.add(_sub(i, ">", float(i)))
+    fired, _, evaluated = index.crossings(PAIR, 2000.0, 0.0, hysteresis=0.01)
+    assert len(fired) == evaluated == 1000
+    # Условие держится выполненным: кандидатов на взведение нет, хотя сработали все
+    assert index.rearm_candidates(PAIR, 2000.0, 0.01) == []
+    assert index.crossings(PAIR, 2000.0, 1.0, hysteresis=0.01)[2] == 0
+    assert _ids(index.rearm_candidates(PAIR, 9.5, 0.01)) == list(range(10, 1001))
+    assert index.count(PAIR) == 1000
+
+
+def test_sql_reads_only_rearm_candidates(tmp_path):
+    async def run():
+        db = Database(str(tmp_path / "rearm.sqlite3"))
+        await db.init()
+        try:
+            await db.add_subscriptions_many([(1, "USD", "EUR", ">", float(i)) for i in range(1, 101)])
+            await _sql_crossings(db, 200.0, 0.0, 0.01, 0.0)
+            _, held = await db.alert_candidates("USD", "EUR", 200.0, 0.01)
+            _, near = await db.alert_candidates("USD", "EUR", 9.5, 0.01)
+            return held, near
+        finally:
+            await db.close()
+
+    held, near = asyncio.run(run())
+    assert held == []
+    assert _ids(near) == list(range(10, 101))
@@ -0,0 +1,79 @@
+import asyncio
+import time
+
+import pytest
+
+from src.cache import SingleFlight, SnapshotCache
+
+
+def test_snapshot_fresh_then_stale_then_gone():
+    cache = SnapshotCache(ttl=0.05, stale_ttl=0.05, max_size=4)
+    snap = cache.put("fiat:USD", {"EUR": 0.9})
+    assert cache.get("fiat:USD") is snap and cache.is_fresh(snap)
+    time.sleep(0.06)
+    # Окно stale-while-revalidate: снимок ещё отдаётся, но уже не свежий
+    assert cache.get("fiat:USD") is snap and not cache.is_fresh(snap)
+    time.sleep(0.05)
+    assert cache.get("fiat:USD") is None
+    assert len(cache) == 0
+
+
+def test_snapshot_cache_evicts_least_recently_used():
+    cache = SnapshotCache(ttl=60, stale_ttl=60, max_size=2)
+    cache.put("fiat:USD", {"EUR": 0.9})
+    cache.put("fiat:EUR", {"USD": 1.1})
+    cache.get("fiat:USD")
+    cache.put("fiat:GBP", {"USD": 1.3})
+    assert cache.get("fiat:EUR") is None
+    assert cache.get("fiat:USD") is not None and cache.get("fiat:GBP") is not None
+
+
+def test_single_flight_coalesces_concurrent_calls():
+    calls = []
+
+    async def fetch():
+        calls.append(1)
+        await asyncio.sleep(0.02)
+        return len(calls)
+
+    async def run():
+        flight = SingleFlight()
+        results = await asyncio.gather(*(flight.do("k", fetch) for _ in range(10)))
+        assert not flight.in_flight("k")
+        # После завершения следующий вызов идёт заново
+        return results, await flight.do("k", fetch)
+
+    results, after = asyncio.run(run())
+    assert results == [1] * 10
+    assert after == 2
+
+
+def test_single_flight_shares_errors():
+    async def fail():
+        await asyncio.sleep(0.01)
+        raise ValueError("upstream down")
+
+    async def run():
+        flight = SingleFlight()
+        return await asyncio.gather(*(flight.do("k", fail) for _ in range(3)), return_exceptions=True)
+
+    results = asyncio.run(run())
+    assert all(isinstance(r, ValueError) for r in results)
+
+
+def test_cancelled_waiter_does_not_cancel_shared_call():
+    async def fetch():
+        await asyncio.sleep(0.05)
+        return "rates"
+
+    async def run():
+        flight = SingleFlight()
+        first = asyncio.ensure_future(flight.do("k", fetch))
+        second = asyncio.ensure_future(flight.do("k", fetch))
+        await asyncio.sleep(0.01)
+        first.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await first
+        return await second
+
+    assert asyncio.run(run()) == "rates"
@@ -0,0 +1,74 @@
+import asyncio
+import time
+
+from src.changes import RateChangeFeed
+from src.config import Settings
+from src.delivery import DeliveryQueue, DigestBuffer
+from src.matrix import RateMatrix
+from src.scheduler import _Notifier
+from src.stats import NotifierStats
+
+
+def _matrix(**usd):
+    matrix = RateMatrix(["USD", *usd])
+    matrix.set_usd("USD", 1.0)
+    for cur, value in usd.items():
+        matrix.set_usd(cur, value)
+    return matrix
+
+
+def test_publish_filters_moves_within_epsilon():
+    async def run():
+        feed = RateChangeFeed(epsilon=0.01)
+        feed.watch([("EUR", "USD"), ("BTC", "USD")])
+        # Первая публикация срабатывает всегда
+        feed.publish(_matrix(EUR=1.08, BTC=65000.0))
+        first = await feed.wait(0.01)
+        # EUR сдвинулся на 0.5% - меньше epsilon, BTC на 2%
+        feed.publish(_matrix(EUR=1.0854, BTC=66300.0))
+        second = await feed.wait(0.01)
+        # EUR сравнивается с последним опубликованным 1.08, а не с 1.0854: события нет, wait ждёт весь timeout
+        feed.publish(_matrix(EUR=1.0854, BTC=66300.0))
+        started = time.monotonic()
+        third = await feed.wait(0.05)
+        return first, second, third, time.monotonic() - started
+
+    first, second, third, waited = asyncio.run(run())
+    assert first == {("EUR", "USD"): 1.08, ("BTC", "USD"): 65000.0}
+    assert second == {("BTC", "USD"): 66300.0}
+    assert third == {} and waited >= 0.045
+
+
+def test_watch_drops_old_pairs():
+    async def run():
+        feed = RateChangeFeed(epsilon=0.01)
+        feed.watch([("EUR", "USD")])
+        feed.publish(_matrix(EUR=1.08))
+        await feed.wait(0.01)
+        feed.watch([("BTC", "USD")])
+        feed.publish(_matrix(EUR=2.0, BTC=65000.0))
+        only_new = await feed.wait(0.01)
+        # Снова подписались на EUR: его прошлое значение забыто, публикация считается первой
+        feed.watch([("EUR", "USD"), ("BTC", "USD")])
+        feed.publish(_matrix(EUR=2.0, BTC=65000.0))
+        return only_new, await feed.wait(0.01)
+
+    only_new, rewatched = asyncio.run(run())
+    assert only_new == {("BTC", "USD"): 65000.0}
+    assert rewatched == {("EUR", "USD"): 2.0}
+
+
+def test_notifier_wakes_for_digest_before_next_tick():
+    async def run():
+        delivery = DeliveryQueue(bot=None)
+        digest = DigestBuffer(delivery, window=5)
+        notifier = _Notifier(Settings(bot_token="x"), None, None, None, delivery, digest, NotifierStats())
+        next_tick = time.monotonic() + 60
+        idle = notifier._wake_at(next_tick)
+        digest.add(1, "USD/EUR > 1")
+        return next_tick, idle, notifier._wake_at(next_tick), notifier._wake_at(time.monotonic() + 1)
+
+    next_tick, idle, with_digest, tick_first = asyncio.run(run())
+    assert idle == next_tick
+    assert with_digest < next_tick - 50
+    assert tick_first < with_digest
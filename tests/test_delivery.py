@@ -0,0 +1,184 @@
+import asyncio
+import time
+
+import pytest
+from aiogram.exceptions import TelegramNetworkError, TelegramRetryAfter
+from aiogram.methods import SendMessage
+
+from src.delivery import DeliveryQueue, DigestBuffer, TokenBucket
+
+
+class FakeBot:
+    """Записывает (время, chat_id, text); ``errors[chat_id]`` - исключения для первых отправок в чат."""
+
+    def __init__(self, errors=None):
+        self.sent = []
+        self.calls = []
+        self.errors = {chat_id: list(errs) for chat_id, errs in (errors or {}).items()}
+
+    async def send_message(self, chat_id, text):
+        now = time.monotonic()
+        self.calls.append((now, chat_id, text))
+        errors = self.errors.get(chat_id)
+        if errors:
+            raise errors.pop(0)
+        self.sent.append((now, chat_id, text))
+
+
+def _retry_after(seconds):
+    return TelegramRetryAfter(SendMessage(chat_id=0, text=""), "Flood control exceeded", seconds)
+
+
+def _network_error():
+    return TelegramNetworkError(SendMessage(chat_id=0, text=""), "Connection reset")
+
+
+def _deliver(bot, messages, **kwargs):
+    async def run():
+        queue = DeliveryQueue(bot, **kwargs)
+        queue.start()
+        started = time.monotonic()
+        for chat_id, text in messages:
+            await queue.put(chat_id, text)
+        await queue.close(drain_timeout=10)
+        return queue.stats, started
+
+    return asyncio.run(run())
+
+
+def _texts(bot, chat_id):
+    return [text for _, c, text in bot.sent if c == chat_id]
+
+
+def _times(bot, chat_id):
+    return [t for t, c, _ in bot.sent if c == chat_id]
+
+
+def test_per_chat_order_and_spacing():
+    bot = FakeBot()
+    messages = [(chat_id, f"{chat_id}-{i}") for i in range(3) for chat_id in (1, 2, 3)]
+    stats, _ = _deliver(bot, messages, workers=4, per_chat_rate=4)
+    assert stats.sent == 9 and stats.failed == 0
+    for chat_id in (1, 2, 3):
+        assert _texts(bot, chat_id) == [f"{chat_id}-{i}" for i in range(3)]
+        times = _times(bot, chat_id)
+        assert all(b - a >= 0.24 for a, b in zip(times, times[1:]))
+    # Чаты не ждут друг друга: первые сообщения всех чатов уходят, не дожидаясь лимита соседних
+    assert max(_times(bot, chat_id)[0] for chat_id in (1, 2, 3)) - bot.sent[0][0] < 0.2
+
+
+def test_token_bucket_limits_rate():
+    async def run():
+        bucket = TokenBucket(rate=100, capacity=1)
+        started = time.monotonic()
+        for _ in range(11):
+            await bucket.acquire()
+        return time.monotonic() - started
+
+    assert asyncio.run(run()) >= 0.095
+
+
+def test_global_limit_spans_chats():
+    bot = FakeBot()
+    # Запас бакета - 40 сообщений, остальные 20 идут со скоростью 40/с
+    stats, started = _deliver(bot, [(chat_id, "hi") for chat_id in range(60)], workers=8, global_rate=40)
+    assert stats.sent == 60
+    assert bot.sent[-1][0] - started >= 0.45
+
+
+def test_retry_after_pauses_all_sends_without_spending_attempts():
+    bot = FakeBot(errors={1: [_retry_after(0.3), _retry_after(0.3)]})
+    stats, _ = _deliver(bot, [(1, "a"), (2, "b"), (3, "c")], workers=1, per_chat_rate=100, max_retries=0)
+    # max_retries=0: если бы flood control тратил попытки, сообщение в чат 1 пропало бы
+    assert stats.sent == 3 and stats.failed == 0
+    assert _texts(bot, 1) == ["a"]
+    paused_at = bot.calls[0][0]
+    assert all(t - paused_at >= 0.29 for t, _, _ in bot.sent)
+
+
+def test_network_errors_retry_with_backoff():
+    bot = FakeBot(errors={1: [_network_error()]})
+    stats, _ = _deliver(bot, [(1, "a"), (1, "b")], workers=2, per_chat_rate=100)
+    assert stats.sent == 2 and stats.retried == 1 and stats.failed == 0
+    first_try, retry = bot.calls[0][0], _times(bot, 1)[0]
+    # Первый отступ - 1 секунда, и следующее сообщение чата не обгоняет повтор
+    assert retry - first_try >= 0.95
+    assert _texts(bot, 1) == ["a", "b"]
+
+
+def test_network_errors_give_up_after_max_retries():
+    bot = FakeBot(errors={1: [_network_error()]})
+    stats, _ = _deliver(bot, [(1, "a"), (2, "b")], max_retries=0)
+    assert stats.failed == 1 and stats.sent == 1
+    assert _texts(bot, 2) == ["b"]
+
+
+def test_put_blocks_when_queue_is_full():
+    async def run():
+        bot = FakeBot()
+        queue = DeliveryQueue(bot, max_queue=2)
+        await queue.put(1, "a")
+        await queue.put(2, "b")
+        blocked = asyncio.ensure_future(queue.put(3, "c"))
+        await asyncio.sleep(0.05)
+        assert not blocked.done()
+        queue.start()
+        await asyncio.wait_for(blocked, 1)
+        await queue.close()
+        return bot
+
+    bot = asyncio.run(run())
+    assert sorted(text for _, _, text in bot.sent) == ["a", "b", "c"]
+
+
+class _Recorder:
+    def __init__(self):
+        self.messages = []
+
+    async def put(self, chat_id, text):
+        self.messages.append((chat_id, text))
+
+
+@pytest.mark.parametrize("count", [1, 3, 400])
+def test_digest_splits_at_max_length(count):
+    lines = [f"USD/EUR > {i}.{'0' * 20} (сейчас {i + 1})" for i in range(count)]
+
+    async def run():
+        recorder = _Recorder()
+        digest = DigestBuffer(recorder)
+        for line in lines:
+            digest.add(7, line)
+        digest.add(8, "BTC/USD > 1")
+        sent = await digest.flush()
+        return recorder.messages, sent, len(digest)
+
+    messages, sent, left = asyncio.run(run())
+    assert left == 0 and sent == len(messages)
+    texts = [text for chat_id, text in messages if chat_id == 7]
+    assert all(len(text) <= DigestBuffer.MAX_LENGTH for text in texts)
+    assert ("BTC/USD > 1" in messages[-1][1]) and messages[-1][0] == 8
+    if count == 1:
+        assert texts == [f"Сработало условие: {lines[0]}"]
+        return
+    # Все строки на месте и в исходном порядке, у продолжений свой заголовок
+    body = [item for text in texts for item in text.split("\n• ")[1:]]
+    assert body == lines
+    assert all(text.startswith(f"🔔 Сработало условий: {count}") for text in texts)
+    assert (len(texts) > 1) is (count == 400)
+    assert all(text.split("\n", 1)[0].endswith("(продолжение)") for text in texts[1:])
+
+
+def test_digest_waits_for_window():
+    async def run():
+        recorder = _Recorder()
+        digest = DigestBuffer(recorder, window=0.1)
+        digest.add(1, "a")
+        early = await digest.flush()
+        await asyncio.sleep(0.11)
+        digest.add(1, "b")
+        late = await digest.flush()
+        return early, late, recorder.messages
+
+    early, late, messages = asyncio.run(run())
+    assert (early, late) == (0, 1)
+    assert messages == [(1, "🔔 Сработало условий: 2\n• a\n• b")]
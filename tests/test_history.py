@@ -0,0 +1,48 @@
+import asyncio
+import time
+
+from src.db import Database
+from src.fake_provider import FakeProviderServer
+from src.history import RAW, RateHistory
+from src.matrix import RateMatrix
+from src.rates import RatesService
+
+
+def test_outage_leaves_a_gap_in_history(tmp_path):
+    async def run():
+        db = Database(str(tmp_path / "history.sqlite3"))
+        await db.init()
+        server = FakeProviderServer(seed=1)
+        rates = RatesService("test", transport=server)
+        history = RateHistory(db)
+        try:
+            fresh = await rates.refresh_matrix()
+            # Прошлое обновление - две минуты назад
+            old = RateMatrix(fresh.currencies, updated_at=fresh.updated_at - 120)
+            for cur, value in fresh.values().items():
+                old.set_usd(cur, value)
+            rates._matrix = old
+            await history.record(old)
+
+            # Фиат недоступен (в кэше при этом ещё лежит таблица USD), CoinGecko отвечает
+            server.host_error_rates.update({"api.exchangerate-api.com": 1.0, "api.exchangerate.host": 1.0})
+            partial = await rates.refresh_matrix()
+            await history.record(partial)
+            # Не отвечает никто: refresh возвращает ту же матрицу, и run_rates_refresher её не пишет
+            server.error_rate = 1.0
+            assert (await rates.refresh_matrix()).updated_at == partial.updated_at
+
+            since, until = old.updated_at + 1, time.time() + 1
+            return (
+                await db.rate_history_series("EUR", RAW, since, until),
+                await db.rate_history_series("BTC", RAW, since, until),
+                await db.rate_history_series("EUR", RAW, old.updated_at, old.updated_at),
+            )
+        finally:
+            await rates.close()
+            await db.close()
+
+    eur_after, btc_after, eur_before = asyncio.run(run())
+    assert eur_after == []
+    assert len(btc_after) == 1
+    assert len(eur_before) == 1
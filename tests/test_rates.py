@@ -0,0 +1,193 @@
+import asyncio
+
+import httpx
+
+from src.fake_provider import FakeProviderServer
+from src.providers import CurrencyConverter5Provider, ExchangeRateApiProvider
+from src.matrix import RateMatrix
+from src.rates import RatesService
+
+
+class _UnauthorizedServer(FakeProviderServer):
+    # rapidapi без ключа: на каждый запрос 401
+    async def handle_async_request(self, request: httpx.Request) -> httpx.Response:
+        if request.url.host == "currency-converter5.p.rapidapi.com":
+            self.requests[request.url.host] += 1
+            return httpx.Response(401, request=request)
+        return await super().handle_async_request(request)
+
+
+def _run(coro_fn, server_cls=FakeProviderServer, **kwargs):
+    async def run():
+        server = server_cls(seed=1)
+        rates = RatesService("test", transport=server, provider_failure_threshold=3, **kwargs)
+        try:
+            return await coro_fn(rates, server)
+        finally:
+            await rates.close()
+
+    return asyncio.run(run())
+
+
+def test_unknown_currencies_do_not_disable_providers():
+    async def scenario(rates, server):
+        for code in ("ABC", "XYZ", "QQQ", "ABC"):
+            assert await rates.get_rate(code, "EUR") is None
+            assert await rates.get_rate("EUR", code) is None
+        assert await rates.get_rate("USD", "EUR") is not None
+        return {h.name: h for h in rates.provider_stats()}
+
+    health = _run(scenario)
+    assert all(h.failures == 0 and h.opened_at is None for h in health.values())
+
+
+def test_codes_outside_the_matrix_still_convert():
+    # Свободный текст ("100 PLN to USD", "EUR>4PLN") идёт через таблицы и пары провайдеров
+    async def scenario(rates, server):
+        server.usd_values["PLN"] = 0.25
+        return await rates.get_rate("PLN", "USD"), await rates.get_rate("EUR", "PLN")
+
+    pln_usd, eur_pln = _run(scenario)
+    assert abs(pln_usd - 0.25) < 1e-9
+    assert abs(eur_pln - 1.08 / 0.25) < 1e-9
+
+
+def test_client_errors_are_not_provider_failures():
+    # Провайдер, который сам не знает валюту, отвечает 404 - это не отказ провайдера
+    async def scenario(rates, server):
+        server.usd_values.pop("KZT")
+        for _ in range(5):
+            await rates._download_fiat_table("KZT")
+        return {h.name: h for h in rates.provider_stats()}
+
+    health = _run(scenario, fiat_providers=[ExchangeRateApiProvider()])
+    api = health["exchangerate-api"]
+    assert api.calls == 5
+    assert api.failures == 0 and api.opened_at is None
+
+
+def test_server_errors_still_open_the_circuit():
+    async def scenario(rates, server):
+        server.host_error_rates["api.exchangerate-api.com"] = 1.0
+        for _ in range(3):
+            await rates._download_fiat_table("EUR")
+        return rates._router.is_available("exchangerate-api")
+
+    assert _run(scenario, fiat_providers=[ExchangeRateApiProvider()]) is False
+
+
+def test_unauthorized_provider_opens_the_circuit():
+    async def scenario(rates, server):
+        for _ in range(10):
+            await rates._fetch_first(rates._pair_providers, "EUR", "PLN")
+        return {h.name: h for h in rates.provider_stats()}["currency-converter5"], server
+
+    health, server = _run(scenario, server_cls=_UnauthorizedServer, pair_providers=[CurrencyConverter5Provider()])
+    assert health.opened_at is not None
+    assert health.success < 1.0
+    # После открытия цепи провайдер больше не вызывается
+    assert server.requests["currency-converter5.p.rapidapi.com"] == 3
+
+
+def _aged(matrix, seconds):
+    # Та же матрица, но полученная ``seconds`` секунд назад
+    old = RateMatrix(matrix.currencies, updated_at=matrix.updated_at - seconds)
+    for cur, value in matrix.values().items():
+        old.set_usd(cur, value)
+    return old
+
+
+def test_outage_keeps_old_fiat_times():
+    async def scenario(rates, server):
+        old = rates._matrix = _aged(await rates.refresh_matrix(), 120)
+        # Фиат недоступен, CoinGecko отвечает: в кэше ещё лежит таблица USD, но в матрицу она не идёт
+        server.host_error_rates.update({"api.exchangerate-api.com": 1.0, "api.exchangerate.host": 1.0})
+        partial = await rates.refresh_matrix()
+        assert partial.updated_at > old.updated_at
+        assert partial.currency_updated_at("EUR") == old.updated_at
+        assert partial.currency_updated_at("BTC") == partial.updated_at
+        assert rates.stale_since("EUR", "USD") == old.updated_at
+        assert rates.stale_since("BTC", "USD") is None
+        # Не отвечает никто - матрица остаётся прежней
+        server.error_rate = 1.0
+        assert await rates.refresh_matrix() is partial
+
+    _run(scenario)
+
+
+def test_get_rates_mixes_matrix_hits_and_misses():
+    async def scenario(rates, server):
+        server.usd_values["PLN"] = 0.25
+        await rates.refresh_matrix()
+        server.reset()
+        pairs = [("usd", "eur"), ("BTC", "USD"), ("EUR", "EUR"), ("PLN", "USD"), ("ABC", "USD"), ("USD", "EUR")]
+        with rates.scoped_counters() as counters:
+            result = await rates.get_rates(pairs, concurrency=2)
+        return result, counters, server.requests
+
+    result, counters, requests = _run(scenario)
+    assert list(result) == [("USD", "EUR"), ("BTC", "USD"), ("EUR", "EUR"), ("PLN", "USD"), ("ABC", "USD")]
+    assert abs(result[("USD", "EUR")] - 1 / 1.08) < 1e-9
+    assert abs(result[("BTC", "USD")] - 65000.0) < 1e-6
+    assert result[("EUR", "EUR")] == 1.0
+    assert abs(result[("PLN", "USD")] - 0.25) < 1e-9
+    assert result[("ABC", "USD")] is None
+    # Пары из матрицы и X/X - без запросов; к провайдерам идут только PLN и ABC
+    assert counters.lookups == 5 and counters.cache_hits == 3
+    assert "api.coingecko.com" not in requests
+
+
+class _ETagServer(httpx.AsyncBaseTransport):
+    # Отвечает 304 на повтор с верным If-None-Match; status задаёт код следующего полного ответа
+    def __init__(self):
+        self.status = 200
+        self.conditional = []
+
+    async def handle_async_request(self, request: httpx.Request) -> httpx.Response:
+        etag = request.headers.get("If-None-Match")
+        self.conditional.append(etag)
+        if etag == '"v1"':
+            return httpx.Response(304, request=request)
+        body = b'{"rates": {"EUR": 0.9}}' if self.status == 200 else b"{}"
+        return httpx.Response(self.status, headers={"ETag": '"v1"'}, content=body, request=request)
+
+
+def test_not_modified_returns_the_cached_body():
+    async def run(conditional):
+        server = _ETagServer()
+        rates = RatesService("test", transport=server, http_conditional_requests=conditional)
+        try:
+            url = "https://api.exchangerate-api.com/v4/latest/USD"
+            first = await rates._download_json(url)
+            second = await rates._download_json(url)
+            return first, second, server.conditional
+        finally:
+            await rates.close()
+
+    first, second, sent = asyncio.run(run(True))
+    assert first == second == {"rates": {"EUR": 0.9}}
+    assert sent == [None, '"v1"']
+    # Без условных запросов валидаторы не отправляются
+    assert asyncio.run(run(False))[2] == [None, None]
+
+
+def test_error_responses_do_not_store_validators():
+    async def run():
+        server = _ETagServer()
+        server.status = 503
+        rates = RatesService("test", transport=server)
+        url = "https://api.exchangerate-api.com/v4/latest/USD"
+        try:
+            try:
+                await rates._download_json(url)
+            except httpx.HTTPStatusError:
+                pass
+            server.status = 200
+            # Ответ 503 с ETag не должен превратить следующий запрос в условный
+            return await rates._download_json(url), server.conditional
+        finally:
+            await rates.close()
+
+    body, sent = asyncio.run(run())
+    assert body == {"rates": {"EUR": 0.9}}
+    assert sent == [None, None]
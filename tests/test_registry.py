@@ -0,0 +1,92 @@
+import asyncio
+
+from src.db import Database
+from src.registry import SubscriptionRegistry, shard_of
+
+
+def _with_db(tmp_path, scenario):
+    async def run():
+        db = Database(str(tmp_path / "registry.sqlite3"))
+        await db.init()
+        try:
+            return await scenario(db)
+        finally:
+            await db.close()
+
+    return asyncio.run(run())
+
+
+async def _expected_ids(db, registry):
+    return sorted(sub["id"] for sub in await db.all_subscriptions() if registry.owns(sub))
+
+
+def test_sync_replays_journal(tmp_path):
+    async def scenario(db):
+        await db.add_subscriptions_many([(1, "USD", "EUR", ">", 1.0), (2, "BTC", "USD", "<", 50000.0)])
+        registry = SubscriptionRegistry(db)
+        await registry.load()
+        assert sorted(registry.index.ids()) == await _expected_ids(db, registry)
+        assert await registry.sync() is False
+
+        await db.add_subscription(3, "EUR", "RUB", ">=", 90.0)
+        await db.remove_subscription(1, "USD", "EUR")
+        loaded_index = registry.index
+        assert await registry.sync() is True
+        # Изменения применены к тому же индексу, без перечитывания таблицы
+        assert registry.index is loaded_index
+        assert sorted(registry.index.ids()) == await _expected_ids(db, registry)
+        assert registry.pairs() == [("BTC", "USD"), ("EUR", "RUB")]
+        assert await registry.sync() is False
+
+    _with_db(tmp_path, scenario)
+
+
+def test_sync_reloads_when_journal_was_pruned(tmp_path):
+    async def scenario(db):
+        await db.add_subscription(1, "USD", "EUR", ">", 1.0)
+        registry = SubscriptionRegistry(db)
+        await registry.load()
+        await db.add_subscriptions_many([(u, "USD", "EUR", ">", float(u)) for u in range(2, 7)])
+        await db.remove_subscription(1, "USD", "EUR")
+        # Другой процесс уже удалил часть журнала, которую этот реестр ещё не видел
+        await db.prune_subscription_changes(registry.version + 3)
+        loaded_index = registry.index
+        assert await registry.sync() is True
+        assert registry.index is not loaded_index
+        assert sorted(registry.index.ids()) == await _expected_ids(db, registry)
+        assert 1 not in registry.index
+
+    _with_db(tmp_path, scenario)
+
+
+def test_sync_prunes_old_changes(tmp_path):
+    async def scenario(db):
+        registry = SubscriptionRegistry(db, keep_changes=2)
+        await registry.load()
+        await db.add_subscriptions_many([(u, "USD", "EUR", ">", float(u)) for u in range(1, 11)])
+        assert await registry.sync() is True
+        oldest, latest = await db.subscription_journal_bounds()
+        assert latest - oldest + 1 == 2
+        assert len(registry) == 10
+
+    _with_db(tmp_path, scenario)
+
+
+def test_shards_keep_only_their_subscriptions(tmp_path):
+    async def scenario(db):
+        await db.add_subscriptions_many([(u, "USD", "EUR", ">", float(u)) for u in range(1, 21)])
+        registries = [SubscriptionRegistry(db, shard=shard, shards=3) for shard in range(3)]
+        for registry in registries:
+            await registry.load()
+        await db.add_subscriptions_many([(u, "BTC", "USD", "<", float(u)) for u in range(1, 21)])
+        await db.remove_subscriptions_many([(u, "USD", "EUR") for u in range(1, 6)])
+        for registry in registries:
+            await registry.sync()
+        owned = [sorted(registry.index.ids()) for registry in registries]
+        for registry, ids in zip(registries, owned):
+            assert ids == await _expected_ids(db, registry)
+            assert all(shard_of(registry.index.get(i), 3) == registry.shard for i in ids)
+        # Каждая подписка ровно в одном шарде
+        assert sorted(i for ids in owned for i in ids) == sorted(s["id"] for s in await db.all_subscriptions())
+
+    _with_db(tmp_path, scenario)
@@ -0,0 +1,117 @@
+import asyncio
+import time
+
+from src.cache import TTLCache
+from src.db import Database
+
+
+def _with_db(tmp_path, scenario, **kwargs):
+    async def run():
+        db = Database(str(tmp_path / "subs.sqlite3"), **kwargs)
+        await db.init()
+        try:
+            return await scenario(db)
+        finally:
+            await db.close()
+
+    return asyncio.run(run())
+
+
+def _no_disk(db):
+    def fail(*args, **kwargs):
+        raise AssertionError("subscriptions read from disk")
+
+    db.iter_subscriptions = fail
+
+
+def test_repeat_listing_is_served_from_cache(tmp_path):
+    async def scenario(db):
+        await db.add_subscription(1, "usd", "eur", ">", 1.0)
+        first = await db.list_subscriptions(1)
+        _no_disk(db)
+        second = await db.list_subscriptions(1)
+        # Вызывающий может менять свой список - кэш от этого не портится
+        second.clear()
+        assert await db.list_subscriptions(1) == first
+        return first, db.subs_cache.stats()
+
+    subs, stats = _with_db(tmp_path, scenario)
+    assert [(s.base, s.quote) for s in subs] == [("USD", "EUR")]
+    assert stats == {"size": 1, "hits": 2, "misses": 1}
+
+
+def test_writes_invalidate_only_their_user(tmp_path):
+    async def scenario(db):
+        await db.add_subscription(1, "USD", "EUR", ">", 1.0)
+        await db.add_subscription(2, "BTC", "USD", "<", 50000.0)
+        await db.list_subscriptions(1)
+        await db.list_subscriptions(2)
+        await db.add_subscription(1, "EUR", "RUB", ">", 90.0)
+        assert db.subs_cache.get(2) is not None
+        assert len(await db.list_subscriptions(1)) == 2
+        await db.remove_subscription(1, "USD", "EUR")
+        assert db.subs_cache.get(2) is not None
+        return await db.list_subscriptions(1)
+
+    subs = _with_db(tmp_path, scenario)
+    assert [(s.base, s.quote) for s in subs] == [("EUR", "RUB")]
+
+
+def test_bulk_writes_invalidate_users(tmp_path):
+    async def scenario(db):
+        for user_id in range(1, 5):
+            await db.add_subscription(user_id, "USD", "EUR", ">", 1.0)
+            await db.list_subscriptions(user_id)
+        # Меньше пользователей, чем в кэше: сбрасываются только они
+        await db.add_subscriptions_many([(1, "BTC", "USD", "<", 1.0), (2, "BTC", "USD", "<", 1.0)])
+        partial = sorted(u for u in range(1, 5) if db.subs_cache.get(u) is not None)
+        await db.list_subscriptions(1)
+        # Больше пользователей, чем в кэше: кэш очищается целиком
+        await db.remove_subscriptions_many([(u, "USD", "EUR") for u in range(2, 10)])
+        return partial, len(db.subs_cache), [len(await db.list_subscriptions(u)) for u in range(1, 5)]
+
+    partial, size, counts = _with_db(tmp_path, scenario)
+    assert partial == [3, 4]
+    assert size == 0
+    assert counts == [2, 1, 0, 0]
+
+
+def test_listing_racing_a_write_is_not_cached(tmp_path):
+    async def scenario(db):
+        await db.add_subscription(1, "USD", "EUR", ">", 1.0)
+        read_done, release = asyncio.Event(), asyncio.Event()
+        iter_subscriptions = db.iter_subscriptions
+
+        async def slow_iter(*args, **kwargs):
+            # Старый список уже прочитан, но ещё не положен в кэш
+            rows = [sub async for sub in iter_subscriptions(*args, **kwargs)]
+            read_done.set()
+            await release.wait()
+            for sub in rows:
+                yield sub
+
+        db.iter_subscriptions = slow_iter
+        reader = asyncio.ensure_future(db.list_subscriptions(1))
+        await read_done.wait()
+        await db.add_subscription(1, "BTC", "USD", "<", 50000.0)
+        release.set()
+        stale = await reader
+        db.iter_subscriptions = iter_subscriptions
+        return stale, db.subs_cache.get(1), await db.list_subscriptions(1)
+
+    stale, cached, fresh = _with_db(tmp_path, scenario)
+    assert len(stale) == 1
+    assert cached is None
+    assert len(fresh) == 2
+
+
+def test_ttl_cache_expires_and_evicts():
+    cache = TTLCache(ttl=0.05, max_size=2)
+    cache.put("a", 1)
+    cache.put("b", 2)
+    assert cache.get("a") == 1
+    cache.put("c", 3)
+    # "b" дольше всех не читали - вытесняется он
+    assert cache.get("b") is None and cache.get("a") == 1 and cache.get("c") == 3
+    time.sleep(0.06)
+    assert cache.get("a") is None and len(cache) == 1
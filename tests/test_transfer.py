@@ -0,0 +1,59 @@
+import asyncio
+
+from src.db import Database
+from src.transfer import export_subscriptions, import_subscriptions
+
+
+def _import(tmp_path, name, content):
+    path = tmp_path / name
+    path.write_text(content, encoding="utf-8")
+
+    async def run():
+        db = Database(str(tmp_path / "transfer.sqlite3"))
+        await db.init()
+        try:
+            counts = await import_subscriptions(db, str(path))
+            out = tmp_path / "out.csv"
+            await export_subscriptions(db, str(out))
+            return counts, out.read_text(encoding="utf-8").splitlines()[1:]
+        finally:
+            await db.close()
+
+    return asyncio.run(run())
+
+
+def test_malformed_jsonl_lines_are_skipped(tmp_path):
+    content = (
+        '{"user_id": 1, "base": "BTC", "quote": "USD", "operator": ">", "threshold": 50000}\n'
+        '{"user_id": 2, "base": "ETH", \n'
+        '{"user_id": 3, "base": "EUR", "quote": "USD", "operator": "<", "threshold": NaN}\n'
+        '[1, 2, 3]\n'
+        '{"user_id": 4, "base": "EUR", "quote": "RUB", "operator": "<", "threshold": 90}\n'
+    )
+    (added, skipped), rows = _import(tmp_path, "subs.jsonl", content)
+    assert (added, skipped) == (2, 3)
+    assert rows == ["1,BTC,USD,>,50000.0", "4,EUR,RUB,<,90.0"]
+
+
+def test_invalid_csv_values_are_skipped(tmp_path):
+    content = (
+        "user_id,base,quote,operator,threshold\n"
+        "1,btc,usd,>,50000\n"
+        "2,,USD,>,1\n"
+        "3,US1,EUR,<,1\n"
+        "4,EUR,USD,<,inf\n"
+        "5,EUR,USD,<\n"
+        "6,EUR,USD,=>,1\n"
+    )
+    (added, skipped), rows = _import(tmp_path, "subs.csv", content)
+    assert (added, skipped) == (1, 5)
+    assert rows == ["1,BTC,USD,>,50000.0"]
+
+
+def test_skipped_records_are_logged_not_printed(tmp_path, capsys, caplog):
+    content = "user_id,base,quote,operator,threshold\n1,EUR,USD,=>,1\n"
+    with caplog.at_level("WARNING", logger="quickconverter.transfer"):
+        (added, skipped), _ = _import(tmp_path, "subs.csv", content)
+    assert (added, skipped) == (0, 1)
+    assert capsys.readouterr().out == ""
+    assert [r.getMessage() for r in caplog.records] == ["skipping record 1: bad operator '=>'"]